@@ -0,0 +1,3 @@
+"""
+Benchmarks du pipeline RAG (extraction, découpage, embeddings, index, API)
+"""
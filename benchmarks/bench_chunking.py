@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Comparaison des stratégies de découpage sur des PDFs synthétiques.
+
+  python -m benchmarks.bench_chunking --pages 5,20,50 --output chunking.json
+
+Pour chaque stratégie ("recursive": 1000 caractères / 200 de recouvrement, "structure":
+titres et paragraphes, taille en tokens): nombre de chunks, texte redondant, chunks tronqués
+par le modèle d'embeddings, temps de découpage et d'embeddings, taux de faits retrouvés.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.bench_rag import _import_pipeline, bench_retrieval
+from benchmarks.measure import time_repeated
+from benchmarks.synthetic_pdf import generate_pdf
+
+logger = logging.getLogger("benchmarks")
+
+STRATEGIES = ("recursive", "structure")
+# Longueur maximale (word pieces) lue par all-MiniLM-L6-v2, au-delà le texte est ignoré
+EMBEDDING_MAX_TOKENS = 256
+
+def bench_strategy(streamlit_app, FAISS, embeddings, documents, facts, strategy: str,
+                   repeat: int, count_tokens) -> Dict[str, Any]:
+    stats, chunks = time_repeated(
+        lambda: streamlit_app.split_documents(documents, strategy=strategy), repeat, items_per_call=len(documents)
+    )
+    texts = [chunk.page_content for chunk in chunks]
+    tokens = [count_tokens(text) for text in texts]
+    source_chars = sum(len(doc.page_content) for doc in documents)
+
+    result: Dict[str, Any] = {
+        "chunking": stats,
+        "chunks": len(chunks),
+        "chunk_chars": sum(len(text) for text in texts),
+        "redundancy_ratio": round(sum(len(text) for text in texts) / source_chars, 3) if source_chars else None,
+        "mean_tokens": round(sum(tokens) / len(tokens), 1) if tokens else None,
+        "max_tokens": max(tokens, default=0),
+        "truncated_chunks": sum(1 for count in tokens if count + 2 > EMBEDDING_MAX_TOKENS),
+    }
+
+    if embeddings is None:
+        return result
+
+    result["embedding"], vectors = time_repeated(
+        lambda: embeddings.embed_documents(texts), repeat, items_per_call=len(texts)
+    )
+    # Encodeur sans cache: la seconde stratégie pose les mêmes questions que la première
+    vector_store = FAISS.from_embeddings(
+        list(zip(texts, vectors)), getattr(embeddings, "base", embeddings), metadatas=[chunk.metadata for chunk in chunks]
+    )
+    result["retrieval"] = bench_retrieval(vector_store, facts)
+    return result
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Comparaison des stratégies de découpage")
+    parser.add_argument("--pages", default="5,20,50", help="Tailles de PDF synthétiques (pages)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="Fichier JSON de résultats (stdout par défaut)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    try:
+        streamlit_app, PyPDFLoader, FAISS, _ = _import_pipeline()
+    except Exception as e:
+        logger.error(f"Dépendances manquantes: {e}")
+        return 1
+
+    from chunking import make_token_counter
+
+    count_tokens = make_token_counter()
+    embeddings = streamlit_app.get_embeddings()
+    if embeddings is None:
+        logger.warning("Modèle d'embeddings indisponible: temps d'embeddings et taux de faits retrouvés ignorés")
+
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="rag_chunking_") as tmp:
+        for pages in (int(value) for value in args.pages.split(",") if value):
+            pdf_path = Path(tmp) / f"synthetic_{pages}p.pdf"
+            facts = generate_pdf(pdf_path, pages, seed=pages)
+            documents = PyPDFLoader(str(pdf_path)).load()
+            logger.info(f"Découpage: {pages} pages")
+            results[f"pages_{pages}"] = {
+                strategy: bench_strategy(
+                    streamlit_app, FAISS, embeddings, documents, facts, strategy, args.repeat, count_tokens
+                )
+                for strategy in STRATEGIES
+            }
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+        logger.info(f"Résultats écrits dans {args.output}")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
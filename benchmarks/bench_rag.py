@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Benchmark reproductible du pipeline RAG.
+
+  python -m benchmarks.bench_rag pipeline --pages 5,20,50 --output results.json
+  python -m benchmarks.bench_rag api --requests 200 --concurrency 8 --output results.json
+  python -m benchmarks.bench_rag all --output current.json --compare baseline.json
+
+Le volet "pipeline" mesure extraction, découpage, embeddings, indexation et recherche
+avec les fonctions de streamlit_app. Le volet "api" lance rag_api.py contre un Ollama factice.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+import requests
+
+from benchmarks.measure import StageRss, compare_results, summarize, time_repeated
+from benchmarks.synthetic_pdf import generate_pdf
+
+logger = logging.getLogger("benchmarks")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_for(url: str, timeout: float = 30) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.1)
+    return False
+
+# ---------------------------------------------------------------------------
+# Pipeline documentaire
+# ---------------------------------------------------------------------------
+
+def _import_pipeline():
+    """
+    Importer streamlit_app hors de `streamlit run` (mode "bare", avertissements masqués)
+    """
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    # Pas de cache disque des questions: chaque exécution encode ses requêtes (--compare)
+    os.environ["QUERY_CACHE_PATH"] = ""
+    sys.path.insert(0, str(ROOT))
+    import streamlit_app
+    from compact_store import CompactVectorStore
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.vectorstores import FAISS
+    return streamlit_app, PyPDFLoader, FAISS, CompactVectorStore
+
+def bench_retrieval(vector_store, facts: List[Dict[str, str]], k: int = 3) -> Dict[str, Any]:
+    """
+    Latence de recherche et part des faits retrouvés dans les k premiers chunks
+    """
+    hits = 0
+    latencies = []
+    with StageRss() as rss:
+        wall_start = time.perf_counter()
+        for fact in facts:
+            start = time.perf_counter()
+            found = vector_store.similarity_search(fact["question"], k=k)
+            latencies.append(time.perf_counter() - start)
+            hits += any(fact["answer"] in doc.page_content for doc in found)
+        wall = time.perf_counter() - wall_start
+    result = summarize(latencies, wall, rss=rss)
+    result["hit_rate"] = round(hits / len(facts), 3) if facts else None
+    return result
+
+def bench_query_encoding(embeddings, questions: List[str], concurrency: int = 8) -> Dict[str, Any]:
+    """
+    Questions encodées en parallèle (regroupées en lots), puis répétées (servies par le cache)
+    """
+    from query_encoder import CachedQueryEmbeddings
+
+    encoder = CachedQueryEmbeddings(getattr(embeddings, "base", embeddings))
+    result = {}
+    for phase in ("cold", "cached"):
+        latencies = []
+
+        def _encode(question: str):
+            start = time.perf_counter()
+            encoder.embed_query(question)
+            latencies.append(time.perf_counter() - start)
+
+        with StageRss() as rss:
+            wall_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(_encode, questions))
+            wall = time.perf_counter() - wall_start
+        result[phase] = summarize(latencies, wall, rss=rss)
+    result["encoder"] = encoder.stats.snapshot()
+    return result
+
+def bench_pipeline(page_counts: List[int], repeat: int, workdir: Path) -> Dict[str, Any]:
+    try:
+        streamlit_app, PyPDFLoader, FAISS, CompactVectorStore = _import_pipeline()
+    except Exception as e:
+        logger.error(f"Pipeline ignoré, dépendances manquantes: {e}")
+        return {"skipped": str(e)}
+
+    import utils
+
+    embeddings = streamlit_app.get_embeddings()
+    if embeddings is None:
+        return {"skipped": "modèle d'embeddings indisponible"}
+    # Index interrogés avec l'encodeur sans cache: chaque recherche encode ses questions
+    # (sinon la recherche compacte ne mesurerait que des hits du cache de la première)
+    uncached = getattr(embeddings, "base", embeddings)
+    uncached.embed_query("warm-up")
+    results = {}
+
+    for pages in page_counts:
+        pdf_path = workdir / f"synthetic_{pages}p.pdf"
+        facts = generate_pdf(pdf_path, pages, seed=pages)
+        stages: Dict[str, Any] = {"pdf_bytes": pdf_path.stat().st_size}
+        logger.info(f"Pipeline: {pages} pages")
+
+        stages["extraction"], documents = time_repeated(
+            lambda: PyPDFLoader(str(pdf_path)).load(), repeat, items_per_call=pages
+        )
+        stages["chunking"], chunks = time_repeated(
+            lambda: streamlit_app.split_documents(documents), repeat, items_per_call=pages
+        )
+        texts = [chunk.page_content for chunk in chunks]
+        stages["chunks"] = len(chunks)
+        stages["chunk_chars"] = sum(len(text) for text in texts)
+
+        stages["embedding"], vectors = time_repeated(
+            lambda: embeddings.embed_documents(texts), repeat, items_per_call=len(texts)
+        )
+        stages["indexing"], vector_store = time_repeated(
+            lambda: FAISS.from_embeddings(
+                list(zip(texts, vectors)), uncached, metadatas=[chunk.metadata for chunk in chunks]
+            ),
+            repeat, items_per_call=len(texts)
+        )
+
+        stages["retrieval"] = bench_retrieval(vector_store, facts)
+        stages["query_encoding"] = bench_query_encoding(embeddings, [fact["question"] for fact in facts])
+
+        def build_compact_store():
+            store = CompactVectorStore(uncached, directory=tempfile.mkdtemp(dir=workdir))
+            store.add_embeddings(texts, vectors, [chunk.metadata for chunk in chunks])
+            return store
+
+        stages["indexing_compact"], compact_store = time_repeated(
+            build_compact_store, repeat, items_per_call=len(texts)
+        )
+        stages["retrieval_compact"] = bench_retrieval(compact_store, facts)
+        stages["memory_compact"] = compact_store.memory_report()
+
+        stages["create_vector_store"], _ = time_repeated(
+            lambda: streamlit_app.create_vector_store(documents), repeat, items_per_call=pages
+        )
+        full_text = "\n".join(doc.page_content for doc in documents)
+        stages["truncate_text"], _ = time_repeated(
+            lambda: utils.truncate_text(full_text, max_tokens=4000), max(repeat, 50)
+        )
+        results[f"pages_{pages}"] = stages
+
+    return results
+
+# ---------------------------------------------------------------------------
+# API sous charge
+# ---------------------------------------------------------------------------
+
+class ApiServers:
+    """
+    Ollama factice + rag_api.py lancés en sous-processus
+    """
+
+    def __init__(self, token_ms: float, response_tokens: int, load_seconds: float, extra_env: Dict[str, str] = None):
+        self.ollama_port = _free_port()
+        self.api_port = _free_port()
+        self.token_ms = token_ms
+        self.response_tokens = response_tokens
+        self.load_seconds = load_seconds
+        self.extra_env = extra_env or {}
+        self.processes: List[subprocess.Popen] = []
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self.api_port}"
+
+    @property
+    def api_pid(self) -> int:
+        return self.processes[-1].pid
+
+    def __enter__(self):
+        ollama = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.fake_ollama",
+            "--port", str(self.ollama_port),
+            "--token-ms", str(self.token_ms),
+            "--response-tokens", str(self.response_tokens),
+            "--load-seconds", str(self.load_seconds),
+        ], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.processes.append(ollama)
+        if not _wait_for(f"http://127.0.0.1:{self.ollama_port}/api/tags"):
+            raise RuntimeError("Ollama factice non démarré")
+
+        env = dict(os.environ, OLLAMA_BASE_URL=f"http://127.0.0.1:{self.ollama_port}", **self.extra_env)
+        api = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "rag_api:app",
+            "--host", "127.0.0.1", "--port", str(self.api_port), "--log-level", "warning",
+        ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.processes.append(api)
+        if not _wait_for(f"{self.api_url}/"):
+            raise RuntimeError("rag_api non démarré")
+        return self
+
+    def __exit__(self, *exc):
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def _run_load(call, total: int, concurrency: int, rss_pid: int) -> Dict[str, Any]:
+    latencies = []
+    errors = 0
+
+    def _one(index: int):
+        start = time.perf_counter()
+        try:
+            ok = call(index)
+        except requests.exceptions.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    # Mémoire du serveur pendant ce scénario seulement
+    with StageRss(rss_pid) as rss:
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for latency, ok in pool.map(_one, range(total)):
+                latencies.append(latency)
+                errors += not ok
+        wall = time.perf_counter() - wall_start
+    return summarize(latencies, wall, errors=errors, rss=rss)
+
+def bench_api(total: int, concurrency: int, token_ms: float, response_tokens: int,
+              context_pages: int) -> Dict[str, Any]:
+    from benchmarks.synthetic_pdf import build_pages
+
+    pages, facts = build_pages(context_pages, seed=42)
+    context = "\n".join("\n".join(lines) for lines in pages)
+    questions = [fact["question"] for fact in facts] or ["Que contient ce document ?"]
+    results: Dict[str, Any] = {"context_chars": len(context)}
+
+    with ApiServers(token_ms, response_tokens, load_seconds=0.0) as servers:
+        url = servers.api_url
+        local = threading.local()
+
+        def _session() -> requests.Session:
+            # Une connexion HTTP persistante par thread client
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+            return local.session
+
+        def query(index: int) -> bool:
+            response = _session().post(f"{url}/query", json={
+                "question": questions[index % len(questions)], "context": context
+            }, timeout=120)
+            return response.status_code == 200
+
+        def chat(index: int) -> bool:
+            response = _session().post(f"{url}/chat", json={"question": questions[index % len(questions)]}, timeout=120)
+            return response.status_code == 200
+
+        session_ids = [
+            requests.post(f"{url}/sessions", json={"context": context}, timeout=10).json()["session_id"]
+            for _ in range(concurrency)
+        ]
+
+        def session_query(index: int) -> bool:
+            session_id = session_ids[index % len(session_ids)]
+            response = _session().post(f"{url}/sessions/{session_id}/query", json={
+                "question": questions[index % len(questions)]
+            }, timeout=120)
+            return response.status_code == 200
+
+        for name, call in (("query", query), ("chat", chat), ("session_query", session_query)):
+            logger.info(f"API: {name} ({total} requêtes, concurrence {concurrency})")
+            results[name] = _run_load(call, total, concurrency, servers.api_pid)
+
+        results["server_metrics"] = requests.get(f"{url}/metrics", timeout=10).json()
+
+    return results
+
+# ---------------------------------------------------------------------------
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline RAG")
+    parser.add_argument("suite", choices=["pipeline", "api", "all"])
+    parser.add_argument("--pages", default="5,20,50", help="Tailles de PDF synthétiques (pages)")
+    parser.add_argument("--repeat", type=int, default=3, help="Répétitions par étape du pipeline")
+    parser.add_argument("--requests", type=int, default=200, help="Requêtes par scénario API")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--token-ms", type=float, default=2.0, help="Latence simulée par token (Ollama factice)")
+    parser.add_argument("--response-tokens", type=int, default=32)
+    parser.add_argument("--context-pages", type=int, default=2, help="Taille du contexte envoyé à /query")
+    parser.add_argument("--output", type=Path, help="Fichier JSON de résultats (stdout par défaut)")
+    parser.add_argument("--compare", type=Path, help="Résultats de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Régression tolérée (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: str(value) for key, value in vars(args).items()},
+        }
+    }
+
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as tmp:
+        workdir = Path(tmp)
+        if args.suite in ("pipeline", "all"):
+            page_counts = [int(value) for value in args.pages.split(",") if value]
+            results["pipeline"] = bench_pipeline(page_counts, args.repeat, workdir)
+        if args.suite in ("api", "all"):
+            results["api"] = bench_api(
+                args.requests, args.concurrency, args.token_ms, args.response_tokens,
+                args.context_pages
+            )
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+        logger.info(f"Résultats écrits dans {args.output}")
+    else:
+        print(output)
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        regressions = compare_results(baseline, results, args.tolerance)
+        for regression in regressions:
+            logger.warning(
+                f"Régression {regression['metric']}: {regression['baseline']} -> "
+                f"{regression['current']} ({regression['change_pct']:+}%)"
+            )
+        if regressions:
+            return 1
+        logger.info("Aucune régression détectée")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
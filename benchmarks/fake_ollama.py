@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Serveur Ollama factice pour les benchmarks: mêmes routes et mêmes compteurs que l'API réelle,
+avec des latences simulées et déterministes.
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+def estimate_prompt_tokens(text: str) -> int:
+    # Même approximation que utils.estimate_tokens
+    return max(1, len(text) // 4)
+
+
+class FakeOllamaState:
+    """
+    Modèles "chargés" et paramètres de simulation
+    """
+
+    def __init__(self, models: List[str], load_seconds: float, prompt_ms_per_token: float,
+                 token_ms: float, response_tokens: int, keep_alive_seconds: float = 300):
+        self.models = models
+        self.load_seconds = load_seconds
+        self.prompt_ms_per_token = prompt_ms_per_token
+        self.token_ms = token_ms
+        self.response_tokens = response_tokens
+        self.keep_alive_seconds = keep_alive_seconds
+        self.loaded: Dict[str, float] = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def load(self, model: str) -> float:
+        """
+        Simuler le chargement du modèle s'il n'est pas résident; retourne la durée en secondes
+        """
+        with self.lock:
+            self.requests += 1
+            expires_at = self.loaded.get(model)
+            cold = expires_at is None or expires_at < time.time()
+            self.loaded[model] = time.time() + self.keep_alive_seconds
+        if cold and self.load_seconds:
+            time.sleep(self.load_seconds)
+        return self.load_seconds if cold else 0.0005
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeOllamaState = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": f"{name}:latest"} for name in self.state.models]})
+        elif self.path == "/api/ps":
+            now = time.time()
+            with self.state.lock:
+                loaded = [name for name, expires_at in self.state.loaded.items() if expires_at > now]
+            self._send_json({"models": [{"name": f"{name}:latest"} for name in loaded]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path == "/api/generate":
+            self._generate(self._read_json())
+        elif self.path == "/api/pull":
+            payload = self._read_json()
+            self.state.models.append(payload.get("name", "unknown"))
+            self._send_json({"status": "success"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _generate(self, payload: Dict[str, Any]):
+        model = payload.get("model", "")
+        load_seconds = self.state.load(model)
+        prompt = payload.get("prompt")
+        stats = {"model": model, "load_duration": int(load_seconds * 1e9)}
+
+        if not prompt:
+            # Requête de préchargement: comme Ollama, pas de statistiques de durée
+            self._send_json({"model": model, "response": "", "done": True, "done_reason": "load"})
+            return
+
+        context = list(payload.get("context") or [])
+        prompt_tokens = estimate_prompt_tokens(prompt)
+        prompt_seconds = prompt_tokens * self.state.prompt_ms_per_token / 1000
+        time.sleep(prompt_seconds)
+
+        words = [f"mot{i}" for i in range(self.state.response_tokens)]
+        stats.update(
+            prompt_eval_count=prompt_tokens,
+            prompt_eval_duration=int(prompt_seconds * 1e9),
+            eval_count=len(words),
+            eval_duration=int(len(words) * self.state.token_ms * 1e6),
+        )
+        new_context = context + list(range(prompt_tokens)) + list(range(len(words)))
+        start = time.time()
+
+        if payload.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for word in words:
+                    time.sleep(self.state.token_ms / 1000)
+                    self._write_chunk({"model": model, "response": word + " ", "done": False})
+                stats["total_duration"] = int((time.time() - start + load_seconds + prompt_seconds) * 1e9)
+                self._write_chunk(dict(stats, response="", done=True, context=new_context))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                logger.debug("Client déconnecté, génération interrompue")
+            return
+
+        time.sleep(len(words) * self.state.token_ms / 1000)
+        stats["total_duration"] = int((time.time() - start + load_seconds + prompt_seconds) * 1e9)
+        self._send_json(dict(stats, response=" ".join(words), done=True, context=new_context))
+
+    def _write_chunk(self, payload: Dict[str, Any]):
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+        self.wfile.flush()
+
+
+def create_server(host: str = "127.0.0.1", port: int = 11435, models: List[str] = None,
+                  load_seconds: float = 0.0, prompt_ms_per_token: float = 0.02,
+                  token_ms: float = 2.0, response_tokens: int = 32) -> ThreadingHTTPServer:
+    state = FakeOllamaState(
+        models=list(models or ["llama2"]),
+        load_seconds=load_seconds,
+        prompt_ms_per_token=prompt_ms_per_token,
+        token_ms=token_ms,
+        response_tokens=response_tokens,
+    )
+    handler = type("BoundFakeOllamaHandler", (FakeOllamaHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur Ollama factice")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--models", default="llama2", help="Modèles disponibles, séparés par des virgules")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Durée simulée d'un chargement à froid")
+    parser.add_argument("--prompt-ms-per-token", type=float, default=0.02)
+    parser.add_argument("--token-ms", type=float, default=2.0, help="Durée simulée par token généré")
+    parser.add_argument("--response-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(
+        args.host, args.port, args.models.split(","), args.load_seconds,
+        args.prompt_ms_per_token, args.token_ms, args.response_tokens
+    )
+    logger.info(f"Ollama factice sur http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Mesures communes aux benchmarks: latences, percentiles, mémoire
+"""
+
+import math
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """
+    Percentile par rang le plus proche sur une liste déjà triée
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def _proc_status_mb(field: str, pid: Optional[int] = None) -> Optional[float]:
+    status = Path(f"/proc/{pid if pid is not None else 'self'}/status")
+    try:
+        lines = status.read_text().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        if line.startswith(f"{field}:"):
+            return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+def current_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """
+    Mémoire résidente actuelle (VmRSS) d'un processus, ou du processus courant
+    """
+    return _proc_status_mb("VmRSS", pid)
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """
+    Pic de mémoire résidente (VmHWM) d'un processus, ou du processus courant,
+    depuis son démarrage ou depuis le dernier `reset_peak_rss`
+    """
+    peak = _proc_status_mb("VmHWM", pid)
+    if peak is not None or pid is not None:
+        return peak
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en kilo-octets sous Linux
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(max_rss / divisor, 1)
+
+def reset_peak_rss(pid: Optional[int] = None) -> bool:
+    """
+    Remettre le pic de mémoire (VmHWM) au niveau actuel (Linux >= 4.0); False si impossible
+    """
+    try:
+        Path(f"/proc/{pid if pid is not None else 'self'}/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+class StageRss:
+    """
+    Pic de mémoire résidente pendant une étape, et sa hausse par rapport au début de l'étape.
+
+    Le pic du processus est remis à zéro à l'entrée; à défaut (autre système, droits),
+    la mémoire résidente est échantillonnée par un thread pendant l'étape.
+    """
+
+    def __init__(self, pid: Optional[int] = None, interval: float = 0.01):
+        self.pid = pid
+        self.interval = interval
+        self.start_mb = None
+        self.peak_mb = None
+        self._sampled = None
+        self._stop = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start_mb = current_rss_mb(self.pid)
+        if not reset_peak_rss(self.pid) and self.start_mb is not None:
+            self._sampled = self.start_mb
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss_mb(self.pid)
+            if rss is not None:
+                self._sampled = max(self._sampled, rss)
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak_mb = max(self._sampled, current_rss_mb(self.pid) or 0.0)
+        else:
+            self.peak_mb = peak_rss_mb(self.pid)
+
+    @property
+    def delta_mb(self) -> Optional[float]:
+        if self.start_mb is None or self.peak_mb is None:
+            return None
+        return round(max(0.0, self.peak_mb - self.start_mb), 1)
+
+def summarize(latencies_s: List[float], wall_s: float, items: int = None, errors: int = 0,
+              rss: Optional[StageRss] = None) -> Dict[str, Any]:
+    """
+    Résumé standard d'une série de mesures (latences en secondes), avec la mémoire
+    mesurée pendant l'étape par `rss`
+    """
+    values = sorted(latency * 1000 for latency in latencies_s)
+    items = len(values) if items is None else items
+
+    def _round(value):
+        return None if value is None else round(value, 3)
+
+    return {
+        "count": len(values),
+        "errors": errors,
+        "items": items,
+        "wall_s": round(wall_s, 4),
+        "throughput_per_s": round(items / wall_s, 2) if wall_s > 0 else None,
+        "mean_ms": _round(sum(values) / len(values)) if values else None,
+        "p50_ms": _round(percentile(values, 50)),
+        "p95_ms": _round(percentile(values, 95)),
+        "p99_ms": _round(percentile(values, 99)),
+        "peak_rss_mb": rss.peak_mb if rss is not None else None,
+        "rss_delta_mb": rss.delta_mb if rss is not None else None,
+    }
+
+def time_repeated(func: Callable[[], Any], repeat: int, items_per_call: int = 1) -> Tuple[Dict[str, Any], Any]:
+    """
+    Exécuter `func` `repeat` fois; retourne le résumé et le dernier résultat
+    """
+    latencies = []
+    result = None
+    with StageRss() as rss:
+        wall_start = time.perf_counter()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            latencies.append(time.perf_counter() - start)
+        wall = time.perf_counter() - wall_start
+    return summarize(latencies, wall, items=items_per_call * repeat, rss=rss), result
+
+# Sens d'amélioration des métriques comparées
+LOWER_IS_BETTER = ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb", "rss_delta_mb")
+HIGHER_IS_BETTER = ("throughput_per_s", "hit_rate")
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.15,
+                    path: str = "") -> List[Dict[str, Any]]:
+    """
+    Comparer deux fichiers de résultats; retourne les métriques ayant régressé au-delà de `tolerance`
+    """
+    regressions = []
+    for key, base_value in baseline.items():
+        if key == "meta" or key not in current:
+            continue
+        current_value = current[key]
+        metric_path = f"{path}.{key}" if path else key
+
+        if isinstance(base_value, dict) and isinstance(current_value, dict):
+            regressions.extend(compare_results(base_value, current_value, tolerance, metric_path))
+            continue
+        if not isinstance(base_value, (int, float)) or not isinstance(current_value, (int, float)):
+            continue
+        if base_value <= 0:
+            continue
+
+        change = (current_value - base_value) / base_value
+        if (key in LOWER_IS_BETTER and change > tolerance) or (key in HIGHER_IS_BETTER and change < -tolerance):
+            regressions.append({
+                "metric": metric_path,
+                "baseline": base_value,
+                "current": current_value,
+                "change_pct": round(change * 100, 1),
+            })
+    return regressions
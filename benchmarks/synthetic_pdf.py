@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Génération de PDFs synthétiques reproductibles (titres, paragraphes, faits à retrouver)
+"""
+
+import random
+import textwrap
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+WORDS = (
+    "analyse document système modèle données résultat méthode contexte projet rapport "
+    "performance mesure réseau serveur client requête réponse index recherche vecteur "
+    "texte page section chapitre étude conclusion objectif budget équipe production "
+    "qualité sécurité stockage mémoire calcul latence débit volume version processus"
+).split()
+
+PROJECT_NAMES = (
+    "Atlas Borée Cassiopée Dorado Éridan Fornax Gémeaux Hydre Indus Lyra "
+    "Mensa Norma Orion Pégase Sagitta Taurus Vela Volans Carina Pictor"
+).split()
+
+LINES_PER_PAGE = 48
+LINE_WIDTH = 90
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 18))
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+def build_pages(pages: int, seed: int = 0, facts_per_page: int = 1) -> Tuple[List[List[str]], List[Dict[str, str]]]:
+    """
+    Construire le texte des pages (listes de lignes) et la liste des faits insérés.
+    Chaque fait est une phrase unique associée à une question dont elle est la réponse.
+    """
+    rng = random.Random(seed)
+    facts = []
+    content: List[List[str]] = []
+    section = 0
+
+    for page_number in range(pages):
+        lines: List[str] = []
+        page_facts = []
+        for _ in range(facts_per_page):
+            name = f"{rng.choice(PROJECT_NAMES)}-{len(facts) + 1}"
+            code = f"{rng.randint(1000, 9999)}-{rng.choice('ABCDEFGH')}{rng.randint(10, 99)}"
+            sentence = f"Le code d'identification du projet {name} est {code}."
+            facts.append({
+                "page": page_number,
+                "question": f"Quel est le code d'identification du projet {name} ?",
+                "answer": code,
+                "sentence": sentence,
+            })
+            page_facts.append(sentence)
+
+        while len(lines) < LINES_PER_PAGE - 6:
+            if rng.random() < 0.25:
+                section += 1
+                lines.extend(["", f"{section}. {rng.choice(WORDS).capitalize()} et {rng.choice(WORDS)}", ""])
+            paragraph = _paragraph(rng)
+            if page_facts and rng.random() < 0.5:
+                paragraph = f"{paragraph} {page_facts.pop()} {_sentence(rng)}"
+            lines.extend(textwrap.wrap(paragraph, LINE_WIDTH))
+            lines.append("")
+
+        for sentence in page_facts:
+            lines.extend(textwrap.wrap(f"{_paragraph(rng)} {sentence}", LINE_WIDTH))
+        content.append(lines)
+
+    return content, facts
+
+def _escape(line: str) -> bytes:
+    encoded = line.encode("cp1252", errors="replace")
+    return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def write_pdf(path: Path, pages: List[List[str]]) -> Path:
+    """
+    Écrire un PDF minimal (police Helvetica standard, sans dépendance externe)
+    """
+    objects: List[bytes] = []
+
+    def add(obj: bytes) -> int:
+        objects.append(obj)
+        return len(objects)
+
+    catalog = add(b"")  # rempli plus bas
+    pages_obj = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    page_ids = []
+    for lines in pages:
+        stream = b"BT /F1 10 Tf 12 TL 50 800 Td\n"
+        stream += b"".join(b"(" + _escape(line) + b") Tj T*\n" for line in lines)
+        stream += b"ET"
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, content)
+        ))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog, xref_offset
+    )
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(bytes(output))
+    return path
+
+def generate_pdf(path: Path, pages: int, seed: int = 0) -> List[Dict[str, str]]:
+    """
+    Générer un PDF de `pages` pages et retourner les faits qu'il contient
+    """
+    content, facts = build_pages(pages, seed=seed)
+    write_pdf(path, content)
+    return facts
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Générer un PDF synthétique")
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(generate_pdf(args.output, args.pages, args.seed), ensure_ascii=False, indent=2))
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Sessions de conversation sur un document avec réutilisation du contexte Ollama
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
+
+from shared_state import FileLock, SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+# Intervalle minimal entre deux nettoyages des fichiers de verrou (stockage partagé)
+LOCK_PRUNE_INTERVAL_SECONDS = 300
+
+CONTEXT_INSTRUCTIONS = (
+    "Réponds en te basant sur le contexte fourni. "
+    "Si l'information n'est pas dans le contexte, indique-le clairement."
+)
+
+def build_context_prefix(context: str) -> str:
+    """
+    Préfixe stable du prompt: identique pour toutes les questions sur un même contexte,
+    ce qui permet à Ollama de réutiliser son cache KV.
+    """
+    return f"""Contexte: {context}
+
+{CONTEXT_INSTRUCTIONS}
+
+"""
+
+def build_question(question: str) -> str:
+    return f"Question: {question}\n\nRéponse:"
+
+def _ms(nanoseconds: Optional[int]) -> Optional[float]:
+    return None if nanoseconds is None else round(nanoseconds / 1e6, 1)
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    model: str
+    context: str
+    # Locataire propriétaire (clé API), seul autorisé à lire, interroger ou supprimer la session
+    tenant: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    # État renvoyé par Ollama (tokens déjà évalués: préfixe + échanges précédents)
+    ollama_context: Optional[List[int]] = None
+    turns: List[Dict[str, Any]] = field(default_factory=list)
+
+    def build_request(self, question: str, max_context_tokens: int) -> Dict[str, Any]:
+        """
+        Construire la requête /api/generate du prochain tour
+        """
+        if self.ollama_context and len(self.ollama_context) <= max_context_tokens:
+            # Seule la nouvelle question est à évaluer, le reste est déjà dans l'état Ollama
+            return {
+                "model": self.model,
+                "prompt": "\n\n" + build_question(question),
+                "context": self.ollama_context,
+            }
+
+        if self.ollama_context:
+            logger.info(f"Session {self.session_id}: contexte Ollama trop long, réinitialisation")
+        return {
+            "model": self.model,
+            "prompt": build_context_prefix(self.context) + build_question(question),
+        }
+
+    def record_turn(self, question: str, ollama_request: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        # Réponse tronquée: pas de contexte renvoyé, le tour suivant repart du prompt complet
+        self.ollama_context = result.get("context") or None
+        self.last_used = time.time()
+        turn = {
+            "turn": len(self.turns) + 1,
+            "question": question,
+            "context_reused": "context" in ollama_request,
+            "prompt_eval_count": result.get("prompt_eval_count"),
+            # Absent des réponses tronquées: None, pour ne pas fausser les moyennes
+            "prompt_eval_ms": _ms(result.get("prompt_eval_duration")),
+            "eval_count": result.get("eval_count"),
+            "total_ms": _ms(result.get("total_duration")),
+            "truncated": result.get("truncated", False),
+        }
+        self.turns.append(turn)
+        return turn
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChatSession":
+        return cls(**data)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "model": self.model,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "context_tokens": len(self.ollama_context or []),
+            "turns": list(self.turns),
+        }
+
+
+@dataclass
+class _TurnSlot:
+    # Créé sur la boucle d'événements au premier tour (asyncio.Lock s'y attache en Python 3.9)
+    lock: Optional[asyncio.Lock] = None
+    # Tours en attente ou en cours: le verrou n'est oublié qu'à zéro
+    users: int = 0
+
+
+class SessionTurnLock:
+    """
+    Verrou des tours d'une session: verrou asyncio du processus, attendu sur la boucle
+    d'événements, puis verrou de fichier avec stockage partagé, attendu dans un thread.
+    L'attente totale est bornée par le `timeout` d'`acquire` (TimeoutError).
+    """
+
+    def __init__(self, slot: _TurnSlot, path: Optional[Path], on_done: Callable[[], None]):
+        self._slot = slot
+        self._path = path
+        self._on_done = on_done
+        self._file_lock: Optional[FileLock] = None
+
+    async def acquire(self, timeout: float):
+        if self._slot.lock is None:
+            self._slot.lock = asyncio.Lock()
+        started = time.monotonic()
+        try:
+            try:
+                await asyncio.wait_for(self._slot.lock.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Tour précédent de la session toujours en cours après {timeout:.1f}s")
+            if self._path is not None:
+                try:
+                    await self._acquire_file_lock(max(0.0, timeout - (time.monotonic() - started)))
+                except BaseException:
+                    self._slot.lock.release()
+                    raise
+        except BaseException:
+            self._on_done()
+            raise
+
+    async def _acquire_file_lock(self, timeout: float):
+        file_lock = FileLock(self._path, timeout=timeout)
+        future = asyncio.get_running_loop().run_in_executor(None, file_lock.acquire)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Requête annulée pendant l'attente: rendre le verrou si le thread finit par l'obtenir
+            def _release_if_acquired(done: asyncio.Future):
+                if not done.cancelled() and done.exception() is None:
+                    file_lock.release()
+            future.add_done_callback(_release_if_acquired)
+            raise
+        self._file_lock = file_lock
+
+    def release(self):
+        if self._file_lock is not None:
+            self._file_lock.release()
+            self._file_lock = None
+        self._slot.lock.release()
+        self._on_done()
+
+
+class SessionStore:
+    """
+    Sessions en mémoire, avec expiration et nombre maximal (les plus anciennes sont évincées).
+
+    Avec `shared_path` (fichier SQLite), les sessions sont enregistrées après chaque tour et
+    relues à chaque accès: plusieurs workers servent alors les mêmes sessions, et les tours
+    d'une session sont sérialisés entre processus par un verrou de fichier.
+    """
+
+    def __init__(self, max_sessions: int = 256, ttl_seconds: float = 3600, shared_path: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._turn_locks: Dict[str, _TurnSlot] = {}
+        self._shared: Optional[SQLiteCache] = None
+        self._lock_dir: Optional[Path] = None
+        self._next_lock_prune = 0.0
+        if shared_path:
+            self._shared = SQLiteCache(shared_path, namespace="sessions", ttl_seconds=ttl_seconds,
+                                       max_entries=max_sessions)
+            self._lock_dir = Path(shared_path).parent / "session-locks"
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        for session_id in [sid for sid, s in self._sessions.items() if s.last_used < cutoff]:
+            del self._sessions[session_id]
+        self._drop_turn_locks()
+
+    def _drop_turn_locks(self):
+        # Verrous des sessions expirées ou évincées, sauf ceux d'un tour en cours
+        for session_id in [sid for sid, slot in self._turn_locks.items()
+                           if sid not in self._sessions and not slot.users]:
+            del self._turn_locks[session_id]
+
+    def _remember(self, session: ChatSession):
+        with self._lock:
+            self._evict_expired()
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._drop_turn_locks()
+
+    def create(self, model: str, context: str, tenant: Optional[str] = None) -> ChatSession:
+        session = ChatSession(session_id=uuid.uuid4().hex, model=model, context=context, tenant=tenant)
+        self._remember(session)
+        self.save(session)
+        if self._lock_dir is not None and time.monotonic() >= self._next_lock_prune:
+            self.prune_lock_files()
+        return session
+
+    def get(self, session_id: str, tenant: Optional[str] = None) -> Optional[ChatSession]:
+        """
+        Session `session_id`; None si elle n'existe pas ou appartient à un autre locataire
+        """
+        session = self._load(session_id)
+        if session is not None and tenant is not None and session.tenant != tenant:
+            return None
+        return session
+
+    def _load(self, session_id: str) -> Optional[ChatSession]:
+        if self._shared is not None:
+            # Toujours relire: un autre worker a pu ajouter un tour
+            data = self._shared.get_json(session_id)
+            if data is None:
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+                return None
+            session = ChatSession.from_dict(data)
+            self._remember(session)
+            return session
+
+        with self._lock:
+            self._evict_expired()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session: ChatSession):
+        """
+        Enregistrer l'état d'une session après un tour (sans effet sans stockage partagé)
+        """
+        if self._shared is not None:
+            self._shared.set_json(session.session_id, session.to_dict())
+
+    def lock(self, session_id: str, tenant: Optional[str] = None) -> Optional["SessionTurnLock"]:
+        """
+        Verrou sérialisant les tours d'une session: chacun dépend du contexte Ollama du précédent.
+        None si la session n'existe pas ou appartient à un autre locataire (aucun verrou créé)
+        """
+        if self.get(session_id, tenant) is None:
+            return None
+        with self._lock:
+            slot = self._turn_locks.setdefault(session_id, _TurnSlot())
+            slot.users += 1
+        path = self._lock_dir / f"{session_id}.lock" if self._lock_dir is not None else None
+        return SessionTurnLock(slot, path, on_done=lambda: self._turn_done(session_id))
+
+    def _turn_done(self, session_id: str):
+        with self._lock:
+            slot = self._turn_locks.get(session_id)
+            if slot is not None:
+                slot.users -= 1
+            self._drop_turn_locks()
+
+    def prune_lock_files(self):
+        """
+        Supprimer les fichiers de verrou des sessions expirées, évincées ou supprimées
+        par un autre worker (chacun sous son verrou, sans attendre un tour en cours)
+        """
+        self._next_lock_prune = time.monotonic() + LOCK_PRUNE_INTERVAL_SECONDS
+        removed = 0
+        for path in self._lock_dir.glob("*.lock"):
+            if self._shared.get(path.stem) is not None:
+                continue
+            file_lock = FileLock(path, blocking=False)
+            if file_lock.acquire():
+                file_lock.unlink()
+                file_lock.release()
+                removed += 1
+        if removed:
+            logger.info(f"{removed} verrou(s) de session supprimé(s)")
+
+    def delete(self, session_id: str, tenant: Optional[str] = None) -> bool:
+        if self.get(session_id, tenant) is None:
+            return False
+        with self._lock:
+            deleted = self._sessions.pop(session_id, None) is not None
+            self._drop_turn_locks()
+        if self._shared is not None:
+            deleted = self._shared.get(session_id) is not None
+            self._shared.delete(session_id)
+            # Fichier de verrou supprimé plus tard (prune_lock_files) si un tour est en cours
+            file_lock = FileLock(self._lock_dir / f"{session_id}.lock", blocking=False)
+            if file_lock.acquire():
+                file_lock.unlink()
+                file_lock.release()
+        return deleted
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Comparer le temps d'évaluation du prompt entre premiers tours et tours suivants
+        """
+        with self._lock:
+            self._evict_expired()
+            turns = [turn for session in self._sessions.values() for turn in session.turns]
+            active = len(self._sessions)
+
+        def _avg(values):
+            values = [v for v in values if v is not None]
+            return round(sum(values) / len(values), 1) if values else None
+
+        cold = [t for t in turns if not t["context_reused"]]
+        reused = [t for t in turns if t["context_reused"]]
+        return {
+            # Avec stockage partagé: sessions vues par ce worker
+            "shared": self._shared is not None,
+            "active": active,
+            "turns": len(turns),
+            "avg_prompt_eval_ms_full_prompt": _avg(t["prompt_eval_ms"] for t in cold),
+            "avg_prompt_eval_ms_context_reused": _avg(t["prompt_eval_ms"] for t in reused),
+            "avg_prompt_eval_tokens_full_prompt": _avg(t["prompt_eval_count"] for t in cold),
+            "avg_prompt_eval_tokens_context_reused": _avg(t["prompt_eval_count"] for t in reused),
+        }
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Découpage des documents selon leur structure (titres, paragraphes, tableaux, pages)
+"""
+
+import re
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+
+from utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# all-MiniLM-L6-v2 tronque au-delà de 256 word pieces (tokens spéciaux compris)
+DEFAULT_MAX_TOKENS = 240
+DEFAULT_MIN_TOKENS = 40
+
+_HEADING_RE = re.compile(
+    r"^(#{1,6}\s+\S.*"                                 # titres markdown
+    r"|(?:\d+(?:\.\d+)*\.?|[IVXLC]+\.|[A-Z]\))\s+[A-ZÀ-Ý].*"  # 1. Titre / 2.3 Titre / IV. / A)
+    r"|(?=[^a-zà-ÿ]*[A-ZÀ-Ý]{2})[A-ZÀ-Ý0-9][A-ZÀ-Ý0-9 '’,:&-]{2,})$"  # LIGNE EN MAJUSCULES
+)
+_TABLE_RE = re.compile(r"\S(?: {2,}|\t+|\s*\|\s*)\S.*(?: {2,}|\t+|\s*\|\s*)\S")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+(?=[A-ZÀ-Ý0-9«\"(])")
+_BLANK_LINE_RE = re.compile(r"\n[ \t]*\n")
+
+@lru_cache(maxsize=4)
+def _load_tokenizer(model_name: str):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+def make_token_counter(model_name: str = "sentence-transformers/all-MiniLM-L6-v2") -> Callable[[str], int]:
+    """
+    Compter les tokens avec le tokenizer du modèle d'embeddings (estimation si indisponible)
+    """
+    try:
+        tokenizer = _load_tokenizer(model_name)
+    except Exception as e:
+        logger.warning(f"⚠️ Tokenizer {model_name} indisponible ({e}), estimation par caractères")
+        return estimate_tokens
+
+    def count(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return count
+
+
+@dataclass
+class Block:
+    start: int
+    end: int
+    kind: str  # "heading", "paragraph" ou "table"
+    tokens: int = 0
+
+
+class StructureAwareChunker:
+    """
+    Découpe chaque page en blocs (titres, paragraphes, tableaux) puis regroupe les blocs
+    en chunks d'au plus `max_tokens` tokens.
+
+    - un titre ouvre toujours un nouveau chunk et reste attaché au bloc qui le suit;
+    - un tableau n'est coupé qu'entre deux lignes, et seulement s'il dépasse `max_tokens`;
+    - un paragraphe trop long est coupé entre deux phrases, avec au plus `overlap_tokens`
+      tokens répétés (0 par défaut);
+    - les chunks ne franchissent pas les sauts de page.
+
+    Chaque chunk est une tranche exacte du texte de sa page: `metadata["start_index"]`
+    et `metadata["end_index"]` donnent sa position, `metadata["page"]` la page.
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS, min_tokens: int = DEFAULT_MIN_TOKENS,
+                 overlap_tokens: int = 0, token_counter: Optional[Callable[[str], int]] = None):
+        if min_tokens > max_tokens:
+            raise ValueError("min_tokens doit être inférieur à max_tokens")
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = token_counter or estimate_tokens
+
+    # ------------------------------------------------------------------
+    # Blocs
+    # ------------------------------------------------------------------
+
+    def _line_spans(self, text: str, start: int, end: int) -> List[tuple]:
+        spans = []
+        position = start
+        for line in text[start:end].split("\n"):
+            line_end = position + len(line)
+            if line.strip():
+                spans.append((position, line_end, line.strip()))
+            position = line_end + 1
+        return spans
+
+    def split_blocks(self, text: str) -> List[Block]:
+        """
+        Repérer titres, paragraphes et tableaux avec leurs positions dans le texte
+        """
+        blocks: List[Block] = []
+        section_start = 0
+        sections = [m.start() for m in _BLANK_LINE_RE.finditer(text)] + [len(text)]
+
+        for section_end in sections:
+            current: Optional[Block] = None
+            lines = self._line_spans(text, section_start, section_end)
+            # Texte extrait d'un PDF: pas de ligne vide entre paragraphes, mais une ligne
+            # nettement plus courte que la largeur du texte et finissant une phrase clôt le paragraphe
+            width = max((len(line) for _, _, line in lines), default=0)
+            paragraph_ended = False
+            for line_start, line_end, line in lines:
+                if len(line) <= 80 and _HEADING_RE.match(line) and not line.endswith((".", ",", ";")):
+                    kind = "heading"
+                elif _TABLE_RE.search(line):
+                    kind = "table"
+                else:
+                    kind = "paragraph"
+
+                mergeable = (
+                    current is not None and current.kind == kind and kind != "heading"
+                    and not (kind == "paragraph" and paragraph_ended)
+                )
+                paragraph_ended = line.endswith((".", "!", "?", ":", "…")) and len(line) < 0.8 * width
+                if mergeable:
+                    current.end = line_end
+                else:
+                    current = Block(line_start, line_end, kind)
+                    blocks.append(current)
+            section_start = section_end
+
+        for block in blocks:
+            block.tokens = self.count_tokens(text[block.start:block.end])
+        return blocks
+
+    def _split_oversized(self, text: str, block: Block) -> List[Block]:
+        """
+        Couper un bloc trop long: entre lignes pour un tableau, entre phrases sinon
+        """
+        if block.kind == "table":
+            units = [(s, e) for s, e, _ in self._line_spans(text, block.start, block.end)]
+        else:
+            units = []
+            position = block.start
+            for match in _SENTENCE_END_RE.finditer(text, block.start, block.end):
+                units.append((position, match.start()))
+                position = match.end()
+            units.append((position, block.end))
+
+        pieces: List[Block] = []
+        current: Optional[Block] = None
+        for unit_start, unit_end in units:
+            tokens = self.count_tokens(text[unit_start:unit_end])
+            if tokens > self.max_tokens:
+                # Phrase ou ligne démesurée: coupe par mots
+                pieces.extend(self._split_words(text, unit_start, unit_end, block.kind))
+                current = None
+                continue
+            if current is not None and current.tokens + tokens <= self.max_tokens:
+                current.end = unit_end
+                current.tokens += tokens
+                continue
+
+            start = unit_start
+            if current is not None and self.overlap_tokens:
+                start = self._overlap_start(text, current, unit_start)
+            current = Block(start, unit_end, block.kind, self.count_tokens(text[start:unit_end]))
+            pieces.append(current)
+        return pieces
+
+    def _overlap_start(self, text: str, previous: Block, unit_start: int) -> int:
+        # Reprendre la fin du morceau précédent, sans dépasser overlap_tokens
+        window = text[previous.start:previous.end]
+        for match in _SENTENCE_END_RE.finditer(window):
+            candidate = previous.start + match.end()
+            if self.count_tokens(text[candidate:previous.end]) <= self.overlap_tokens:
+                return candidate
+        return unit_start
+
+    def _split_words(self, text: str, start: int, end: int, kind: str) -> List[Block]:
+        pieces = []
+        piece_start = start
+        position = start
+        for match in re.finditer(r"\S+", text[start:end]):
+            word_start = start + match.start()
+            word_end = start + match.end()
+            if self.count_tokens(text[piece_start:word_end]) > self.max_tokens:
+                if self.count_tokens(text[word_start:word_end]) > self.max_tokens:
+                    # Suite sans espace démesurée (URL, base64, tableau aplati): coupe par caractères
+                    if position > piece_start:
+                        pieces.append(Block(piece_start, position, kind))
+                    pieces.extend(self._split_chars(text, word_start, word_end, kind))
+                    piece_start = position = word_end
+                    continue
+                if position > piece_start:
+                    pieces.append(Block(piece_start, position, kind))
+                    piece_start = word_start
+            position = word_end
+        if text[piece_start:end].strip():
+            pieces.append(Block(piece_start, end, kind))
+        for piece in pieces:
+            piece.tokens = self.count_tokens(text[piece.start:piece.end])
+        return pieces
+
+    def _split_chars(self, text: str, start: int, end: int, kind: str) -> List[Block]:
+        # Plus long préfixe tenant dans max_tokens (recherche dichotomique), au moins un caractère
+        pieces = []
+        while start < end:
+            low, high = start + 1, end
+            while low < high:
+                middle = (low + high + 1) // 2
+                if self.count_tokens(text[start:middle]) <= self.max_tokens:
+                    low = middle
+                else:
+                    high = middle - 1
+            pieces.append(Block(start, low, kind))
+            start = low
+        return pieces
+
+    # ------------------------------------------------------------------
+    # Chunks
+    # ------------------------------------------------------------------
+
+    def split_text_spans(self, text: str) -> List[Block]:
+        """
+        Positions (début, fin) des chunks d'une page
+        """
+        blocks: List[Block] = []
+        for block in self.split_blocks(text):
+            if block.tokens > self.max_tokens:
+                blocks.extend(self._split_oversized(text, block))
+            else:
+                blocks.append(block)
+
+        chunks: List[Block] = []
+        current: Optional[Block] = None
+        pending_heading = False
+        for block in blocks:
+            starts_section = block.kind == "heading"
+            fits = current is not None and current.tokens + block.tokens <= self.max_tokens
+            # Un titre ouvre un nouveau chunk, sauf si le chunk courant est trop petit pour exister seul
+            if fits and (pending_heading or not starts_section or current.tokens < self.min_tokens):
+                current.end = block.end
+                current.tokens += block.tokens
+            else:
+                current = Block(block.start, block.end, block.kind, block.tokens)
+                chunks.append(current)
+            pending_heading = starts_section
+
+        # Un dernier chunk trop petit rejoint le précédent s'il y a la place
+        if len(chunks) > 1 and chunks[-1].tokens < self.min_tokens:
+            last, previous = chunks[-1], chunks[-2]
+            if previous.tokens + last.tokens <= self.max_tokens:
+                previous.end = last.end
+                previous.tokens += last.tokens
+                chunks.pop()
+        return chunks
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Découper des documents (une page par document, comme PyPDFLoader)
+        """
+        chunks = []
+        for document in documents:
+            text = document.page_content
+            for span in self.split_text_spans(text):
+                metadata = dict(document.metadata)
+                metadata.update(start_index=span.start, end_index=span.end, tokens=span.tokens)
+                chunks.append(Document(page_content=text[span.start:span.end], metadata=metadata))
+        return chunks
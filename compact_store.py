@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Vector store compact: vecteurs quantifiés en mémoire, texte et vecteurs complets sur disque (mmap)
+"""
+
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+import uuid
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from shared_state import FileLock
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = {
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+}
+
+TEXTS_FILE = "texts.bin"
+VECTORS_FILE = "vectors.f16"
+INDEX_FILE = "index.faiss"
+OFFSETS_FILE = "offsets.npy"
+METADATAS_FILE = "metadatas.json"
+# Écrit en dernier: sa présence signifie que l'index est complet
+MANIFEST_FILE = "manifest.json"
+
+
+class CompactVectorStore(VectorStore):
+    """
+    Alternative à FAISS + InMemoryDocstore pour les gros corpus.
+
+    - l'index de recherche ne garde que des codes int8 (1 octet/dimension) ou float16;
+    - les vecteurs float16 sont écrits dans un fichier mappé en mémoire et ne servent
+      qu'à re-scorer les `k * rescore_factor` meilleurs candidats (mode int8);
+    - le texte des chunks est ajouté à un fichier binaire et référencé par (offset, longueur),
+      au lieu d'un objet Document par chunk.
+
+    Un store enregistré (`save`) peut être ouvert en lecture seule par plusieurs processus
+    (`load`): index, vecteurs, positions et texte sont mappés en mémoire et partagés
+    via le cache de pages du système.
+    """
+
+    def __init__(self, embedding: Embeddings, directory: Optional[str] = None,
+                 quantization: str = "int8", rescore_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Quantification inconnue: {quantization}")
+
+        self.embedding = embedding
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.directory = Path(directory or Path("faiss_index") / f"compact-{uuid.uuid4().hex}")
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.index = None
+        self.dimension: Optional[int] = None
+        self.metadatas: List[Dict[str, Any]] = []
+        self._offsets = np.zeros((0, 2), dtype=np.int64)
+        self._texts_end = 0
+        self._texts_map: Optional[mmap.mmap] = None
+        self._vectors: Optional[np.memmap] = None
+        self.read_only = False
+        # Taille estimée qu'auraient occupée les mêmes chunks dans FAISS + InMemoryDocstore
+        self._python_text_bytes = 0
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    # ------------------------------------------------------------------
+    # Écriture
+    # ------------------------------------------------------------------
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas)
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]],
+                       metadatas: Optional[List[dict]] = None) -> List[str]:
+        if not texts:
+            return []
+        if self.read_only:
+            raise ValueError(f"Store {self.directory} ouvert en lecture seule")
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.index is None:
+            self.dimension = vectors.shape[1]
+            self.index = faiss.IndexScalarQuantizer(
+                self.dimension, QUANTIZATIONS[self.quantization], faiss.METRIC_L2
+            )
+            # Le quantifieur apprend les bornes de chaque dimension sur le premier lot
+            self.index.train(vectors)
+
+        start_id = len(self._offsets)
+        self.index.add(vectors)
+        self._append_vectors(vectors)
+        self._append_texts(texts)
+        self.metadatas.extend(dict(metadata) for metadata in (metadatas or [{} for _ in texts]))
+        self._python_text_bytes += sum(sys.getsizeof(text) for text in texts)
+        return [str(i) for i in range(start_id, start_id + len(texts))]
+
+    def _append_texts(self, texts: List[str]):
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.empty((len(encoded), 2), dtype=np.int64)
+        position = self._texts_end
+        with open(self.directory / TEXTS_FILE, "ab") as handle:
+            for i, data in enumerate(encoded):
+                handle.write(data)
+                offsets[i] = (position, len(data))
+                position += len(data)
+        self._texts_end = position
+        self._offsets = np.concatenate([self._offsets, offsets])
+        # Le mmap est recréé à la prochaine lecture pour couvrir les nouvelles données
+        self._close_texts_map()
+
+    def _append_vectors(self, vectors: np.ndarray):
+        with open(self.directory / VECTORS_FILE, "ab") as handle:
+            handle.write(vectors.astype(np.float16).tobytes())
+        self._vectors = None
+
+    # ------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------
+
+    def _close_texts_map(self):
+        if self._texts_map is not None:
+            self._texts_map.close()
+            self._texts_map = None
+
+    def _open_maps(self):
+        if self._texts_map is None and self._texts_end:
+            with open(self.directory / TEXTS_FILE, "rb") as handle:
+                self._texts_map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._vectors is None and len(self._offsets):
+            self._vectors = np.memmap(
+                self.directory / VECTORS_FILE, dtype=np.float16, mode="r",
+                shape=(len(self._offsets), self.dimension)
+            )
+
+    def _text(self, index: int) -> str:
+        if self._texts_map is None:
+            self._open_maps()
+        offset, length = self._offsets[index]
+        return self._texts_map[offset:offset + length].decode("utf-8") if length else ""
+
+    def _full_vectors(self, ids: np.ndarray) -> np.ndarray:
+        if self._vectors is None:
+            self._open_maps()
+        return np.asarray(self._vectors[ids], dtype=np.float32)
+
+    def _document(self, index: int) -> Document:
+        return Document(page_content=self._text(index), metadata=dict(self.metadatas[index]))
+
+    def _search(self, query_vector: np.ndarray, k: int, fetch_k: int) -> List[Tuple[int, float]]:
+        if self.index is None or k <= 0:
+            return []
+
+        fetch_k = min(max(k, fetch_k), len(self))
+        distances, ids = self.index.search(query_vector.reshape(1, -1), fetch_k)
+        ids = ids[0][ids[0] >= 0]
+        if self.quantization == "int8" and len(ids) > k:
+            # Re-scoring des candidats avec les vecteurs float16
+            full = self._full_vectors(ids)
+            exact = ((full - query_vector) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            return [(int(ids[i]), float(exact[i])) for i in order]
+        return [(int(i), float(d)) for i, d in zip(ids[:k], distances[0][:k])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        query_vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        fetch_k = k * self.rescore_factor if self.quantization == "int8" else k
+        return [(self._document(i), score) for i, score in self._search(query_vector, k, fetch_k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        # Même conversion distance L2 -> pertinence que le FAISS de langchain
+        return [
+            (doc, 1.0 - score / np.sqrt(2))
+            for doc, score in self.similarity_search_with_score(query, k, **kwargs)
+        ]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        query_vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        candidates = [i for i, _ in self._search(query_vector, fetch_k, fetch_k)]
+        if not candidates:
+            return []
+        selected = maximal_marginal_relevance(
+            query_vector, self._full_vectors(np.asarray(candidates)), k=k, lambda_mult=lambda_mult
+        )
+        return [self._document(candidates[i]) for i in selected]
+
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   **kwargs: Any) -> "CompactVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    # ------------------------------------------------------------------
+    # Persistance
+    # ------------------------------------------------------------------
+
+    def save(self):
+        """
+        Écrire l'index, les positions et les métadonnées à côté du texte et des vecteurs
+        """
+        if self.index is None:
+            raise ValueError("Store vide")
+        faiss.write_index(self.index, str(self.directory / INDEX_FILE))
+        np.save(self.directory / OFFSETS_FILE, self._offsets)
+        (self.directory / METADATAS_FILE).write_text(
+            json.dumps(self.metadatas, ensure_ascii=False), encoding="utf-8"
+        )
+        (self.directory / MANIFEST_FILE).write_text(json.dumps({
+            "quantization": self.quantization,
+            "dimension": self.dimension,
+            "chunks": len(self),
+        }), encoding="utf-8")
+
+    @classmethod
+    def load(cls, directory, embedding: Embeddings, rescore_factor: int = 4) -> "CompactVectorStore":
+        """
+        Ouvrir en lecture seule un store enregistré par `save`
+        """
+        directory = Path(directory)
+        manifest = json.loads((directory / MANIFEST_FILE).read_text(encoding="utf-8"))
+        store = cls(embedding, directory, manifest["quantization"], rescore_factor)
+        try:
+            store.index = faiss.read_index(
+                str(directory / INDEX_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+        except RuntimeError:
+            # Versions de FAISS sans mmap pour ce type d'index: lecture en mémoire
+            store.index = faiss.read_index(str(directory / INDEX_FILE))
+        store.dimension = manifest["dimension"]
+        store._offsets = np.load(directory / OFFSETS_FILE, mmap_mode="r")
+        store._texts_end = int(store._offsets[-1].sum()) if len(store._offsets) else 0
+        store.metadatas = json.loads((directory / METADATAS_FILE).read_text(encoding="utf-8"))
+        # Ordre de grandeur de str en CPython: en-tête + 1 octet par caractère ASCII
+        store._python_text_bytes = store._texts_end + len(store._offsets) * sys.getsizeof("")
+        store.read_only = True
+        # Fichiers projetés dès l'ouverture: le store reste lisible si prune_stores le supprime
+        store._open_maps()
+        try:
+            # Date de dernière utilisation, pour prune_stores
+            os.utime(directory / MANIFEST_FILE)
+        except OSError:
+            pass
+        return store
+
+    @classmethod
+    def load_or_build(cls, directory, embedding: Embeddings,
+                      build: Callable[[], Tuple[List[str], List[dict]]],
+                      quantization: str = "int8", rescore_factor: int = 4) -> "CompactVectorStore":
+        """
+        Ouvrir le store de `directory`, ou le construire avec `build()` (textes, métadonnées)
+        s'il n'existe pas encore.
+
+        La construction se fait sous verrou de fichier dans un répertoire temporaire renommé
+        à la fin: un seul processus indexe un même document, les autres attendent puis
+        ouvrent le résultat, et aucun lecteur ne voit d'index incomplet.
+        """
+        directory = Path(directory)
+        if not (directory / MANIFEST_FILE).exists():
+            with FileLock(directory.parent / f"{directory.name}.lock"):
+                if not (directory / MANIFEST_FILE).exists():
+                    staging = directory.parent / f".{directory.name}-{uuid.uuid4().hex}"
+                    try:
+                        store = cls(embedding, staging, quantization, rescore_factor)
+                        texts, metadatas = build()
+                        store.add_texts(texts, metadatas)
+                        store.save()
+                        store.close()
+                        shutil.rmtree(directory, ignore_errors=True)
+                        os.rename(staging, directory)
+                    finally:
+                        shutil.rmtree(staging, ignore_errors=True)
+                    logger.info(f"Index compact enregistré dans {directory}")
+        try:
+            return cls.load(directory, embedding, rescore_factor)
+        except FileNotFoundError:
+            # Supprimé par prune_stores entre la vérification et la lecture: reconstruire
+            logger.info(f"Index compact {directory} supprimé pendant son ouverture, reconstruction")
+            return cls.load_or_build(directory, embedding, build, quantization, rescore_factor)
+
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        Octets par chunk: FAISS float32 + Document en mémoire (estimation) contre stockage compact
+        """
+        chunks = len(self)
+        if not chunks:
+            return {"chunks": 0}
+
+        dimension = self.dimension
+        metadata_bytes = sum(sys.getsizeof(m) for m in self.metadatas) / chunks
+        # Document + id du docstore + entrée du mapping index -> id (ordre de grandeur CPython)
+        document_overhead = sys.getsizeof(Document(page_content="")) + 2 * sys.getsizeof(uuid.uuid4().hex) + 64
+        before = 4 * dimension + self._python_text_bytes / chunks + metadata_bytes + document_overhead
+        ram = self.index.sa_code_size() + self._offsets.itemsize * 2 + metadata_bytes
+        disk = 2 * dimension + self._texts_end / chunks
+
+        return {
+            "chunks": chunks,
+            "dimension": dimension,
+            "quantization": self.quantization,
+            "before_bytes_per_chunk": round(before),
+            "after_ram_bytes_per_chunk": round(ram),
+            "after_disk_bytes_per_chunk": round(disk),
+            "ram_reduction": round(1 - ram / before, 3),
+        }
+
+    def close(self):
+        self._close_texts_map()
+        self._vectors = None
+
+    def delete_files(self):
+        """
+        Supprimer les fichiers du store (texte et vecteurs)
+        """
+        if self.read_only:
+            raise ValueError(f"Store {self.directory} partagé: suppression refusée")
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _directory_bytes(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.iterdir() if path.is_file())
+
+def _remove_store(directory: Path):
+    # Renommage atomique: un lecteur voit le store complet ou rien
+    trash = directory.parent / f".{directory.name}-{uuid.uuid4().hex}"
+    os.rename(directory, trash)
+    shutil.rmtree(trash, ignore_errors=True)
+
+def prune_stores(root, max_age_seconds: float = 0, max_bytes: int = 0, keep: Iterable[str] = ()) -> List[str]:
+    """
+    Supprimer les stores de `root` (enregistrés par `load_or_build`) inutilisés depuis
+    `max_age_seconds`, puis les moins récemment ouverts tant que leur taille totale dépasse
+    `max_bytes` (0 = pas de limite), sauf ceux de `keep`. Retourne les noms supprimés.
+
+    Chaque store est supprimé sous son verrou, jamais pendant sa construction; les processus
+    qui l'ont déjà ouvert continuent de le lire. Les répertoires temporaires abandonnés
+    (construction interrompue) sont supprimés aussi.
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    now = time.time()
+    keep = set(keep)
+    stores = []
+    for directory in root.iterdir():
+        if not directory.is_dir():
+            continue
+        if directory.name.startswith("."):
+            # .<nom>-<uuid>: construction en cours (verrou <nom>.lock détenu) ou abandonnée
+            name = directory.name[1:-33]
+            lock = FileLock(root / f"{name}.lock", blocking=False)
+            if lock.acquire():
+                shutil.rmtree(directory, ignore_errors=True)
+                lock.release()
+            continue
+        manifest = directory / MANIFEST_FILE
+        if manifest.exists():
+            stores.append((manifest.stat().st_mtime, directory, _directory_bytes(directory)))
+
+    stores.sort(key=lambda item: item[0])
+    total = sum(size for _, _, size in stores) if max_bytes else 0
+    removed = []
+    for last_used, directory, size in stores:
+        if directory.name in keep:
+            continue
+        expired = max_age_seconds and last_used < now - max_age_seconds
+        if not expired and not (max_bytes and total > max_bytes):
+            continue
+        lock = FileLock(root / f"{directory.name}.lock", blocking=False)
+        if not lock.acquire():
+            continue
+        try:
+            _remove_store(directory)
+            lock.unlink()
+        finally:
+            lock.release()
+        total -= size
+        removed.append(directory.name)
+    if removed:
+        logger.info(f"{len(removed)} index compact(s) supprimé(s) de {root}")
+    return removed
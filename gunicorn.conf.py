@@ -0,0 +1,24 @@
+"""
+Déploiement multi-workers de l'API: gunicorn -c gunicorn.conf.py rag_api:app
+
+Chaque worker est un processus uvicorn indépendant; sessions et réponses en cache sont
+partagées via le fichier SQLite RAG_SHARED_STATE_PATH (voir shared_state.py).
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("API_BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# Les générations sont asynchrones et ne bloquent pas la boucle d'un worker; plusieurs
+# workers répartissent le reste (validation, JSON) sur les cœurs: un par cœur, plafonné
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 8)))
+# Battement de cœur d'UvicornWorker: relance d'un worker dont la boucle d'événements
+# ne répond plus. Sans rapport avec la durée des générations (OLLAMA_MAX_TIMEOUT_SECONDS)
+timeout = int(os.getenv("API_WORKER_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+
+# Lus par rag_api à l'import dans chaque worker (quotas répartis, état partagé)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+os.environ.setdefault("RAG_SHARED_STATE_PATH", "data/cache/rag_api.sqlite")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Gestion de la résidence des modèles Ollama (préchargement, keep-alive, cold starts)
+"""
+
+import re
+import threading
+import time
+import logging
+from typing import Dict, Any, Iterable, Optional
+
+from utils import ensure_ollama_model, preload_ollama_model, get_running_models
+
+logger = logging.getLogger(__name__)
+
+# Au-delà de ce temps de chargement, on considère qu'Ollama a dû charger le modèle
+COLD_START_THRESHOLD_SECONDS = 0.5
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+def _normalize_model_name(model_name: str) -> str:
+    # Ollama renvoie "llama2:latest" là où l'interface utilise "llama2"
+    return model_name[:-len(":latest")] if model_name.endswith(":latest") else model_name
+
+def parse_keep_alive(keep_alive: str) -> Optional[float]:
+    """
+    Convertir une valeur keep_alive Ollama ("30m", "1h", "300", "-1") en secondes.
+    Retourne None pour une durée infinie.
+    """
+    value = str(keep_alive).strip()
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)([smh]?)", value)
+    if not match:
+        logger.warning(f"⚠️ keep_alive invalide: {keep_alive}, utilisation de 5m")
+        return 300.0
+
+    amount = float(match.group(1))
+    if amount < 0:
+        return None
+    return amount * _DURATION_UNITS.get(match.group(2) or "s", 1)
+
+
+class ModelResidencyTracker:
+    """
+    Suivi des modèles chargés dans Ollama et des statistiques de chargement
+    """
+
+    def __init__(self, base_url: str, keep_alive: str = "30m"):
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self._keep_alive_seconds = parse_keep_alive(keep_alive)
+        self._lock = threading.Lock()
+        # modèle -> instant d'expiration estimé (None = jamais)
+        self._resident: Dict[str, Optional[float]] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        # Durée totale du dernier préchargement (None tant qu'il n'est pas terminé)
+        self.preload_seconds: Optional[float] = None
+
+    def _model_stats(self, model_name: str) -> Dict[str, Any]:
+        return self._stats.setdefault(model_name, {
+            "requests": 0,
+            "cold_starts": 0,
+            "total_load_seconds": 0.0,
+            "max_load_seconds": 0.0,
+            "last_load_seconds": None,
+            "preloaded": False,
+            "preload_seconds": None,
+        })
+
+    def _mark_resident(self, model_name: str):
+        if self._keep_alive_seconds is None:
+            self._resident[model_name] = None
+        elif self._keep_alive_seconds == 0:
+            self._resident.pop(model_name, None)
+        else:
+            self._resident[model_name] = time.time() + self._keep_alive_seconds
+
+    def record_generation(self, model_name: str, result: Dict[str, Any]):
+        """
+        Enregistrer une réponse /api/generate (utilise load_duration renvoyé par Ollama)
+        """
+        model_name = _normalize_model_name(model_name)
+        load_seconds = result.get("load_duration", 0) / 1e9
+        with self._lock:
+            stats = self._model_stats(model_name)
+            stats["requests"] += 1
+            if load_seconds >= COLD_START_THRESHOLD_SECONDS:
+                stats["cold_starts"] += 1
+                stats["total_load_seconds"] += load_seconds
+                stats["max_load_seconds"] = max(stats["max_load_seconds"], load_seconds)
+                stats["last_load_seconds"] = load_seconds
+                logger.info(f"🥶 Cold start du modèle {model_name}: {load_seconds:.2f}s")
+            self._mark_resident(model_name)
+
+    def preload(self, model_names: Iterable[str], pull_missing: bool = True):
+        """
+        Précharger une liste de modèles (téléchargement si nécessaire)
+        """
+        start = time.perf_counter()
+        for model_name in map(_normalize_model_name, model_names):
+            if pull_missing and not ensure_ollama_model(model_name, self.base_url):
+                logger.error(f"❌ Modèle {model_name} indisponible, préchargement ignoré")
+                continue
+
+            load_seconds = preload_ollama_model(model_name, self.base_url, self.keep_alive)
+            if load_seconds is None:
+                continue
+
+            with self._lock:
+                stats = self._model_stats(model_name)
+                stats["preloaded"] = True
+                stats["preload_seconds"] = load_seconds
+                self._mark_resident(model_name)
+
+        self.preload_seconds = round(time.perf_counter() - start, 3)
+        logger.info(f"Préchargement terminé en {self.preload_seconds}s")
+
+    def preload_in_background(self, model_names: Iterable[str]) -> threading.Thread:
+        """
+        Lancer le préchargement sans bloquer le démarrage de l'API
+        """
+        thread = threading.Thread(
+            target=self.preload, args=(list(model_names),), name="ollama-preload", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def refresh(self):
+        """
+        Resynchroniser la liste des modèles résidents avec Ollama (/api/ps)
+        """
+        running = get_running_models(self.base_url)
+        if running is None:
+            return
+
+        running = {_normalize_model_name(name) for name in running}
+        with self._lock:
+            for model_name in running:
+                if model_name not in self._resident:
+                    self._mark_resident(model_name)
+            for model_name in list(self._resident):
+                if model_name not in running:
+                    del self._resident[model_name]
+
+    def is_resident(self, model_name: str) -> bool:
+        model_name = _normalize_model_name(model_name)
+        with self._lock:
+            if model_name not in self._resident:
+                return False
+            expires_at = self._resident[model_name]
+            return expires_at is None or expires_at > time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Statistiques de résidence et de cold starts par modèle
+        """
+        with self._lock:
+            now = time.time()
+            resident = sorted(
+                name for name, expires_at in self._resident.items()
+                if expires_at is None or expires_at > now
+            )
+            models = {}
+            for name, stats in self._stats.items():
+                cold_starts = stats["cold_starts"]
+                models[name] = dict(
+                    stats,
+                    avg_load_seconds=round(stats["total_load_seconds"] / cold_starts, 3) if cold_starts else None,
+                )
+            return {
+                "keep_alive": self.keep_alive,
+                "preload_seconds": self.preload_seconds,
+                "resident": resident,
+                "cold_starts": sum(stats["cold_starts"] for stats in self._stats.values()),
+                "models": models,
+            }
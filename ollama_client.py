@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Appels à /api/generate en streaming: échéance, reprises sur erreur de connexion,
+annulation si le client se déconnecte, réponse partielle si l'échéance est atteinte
+"""
+
+import asyncio
+import json
+import random
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Intervalle entre deux vérifications de la connexion du client
+DISCONNECT_CHECK_INTERVAL = 0.25
+
+
+class GenerationError(Exception):
+    """
+    Échec d'une génération, avec le code HTTP à renvoyer au client et le nombre
+    de tokens déjà produits par Ollama (à décompter des quotas)
+    """
+    status_code = 502
+
+    def __init__(self, message: str, generated_tokens: int = 0):
+        super().__init__(message)
+        self.generated_tokens = generated_tokens
+
+
+class OllamaUnavailable(GenerationError):
+    status_code = 503
+
+
+class DeadlineExceeded(GenerationError):
+    status_code = 504
+
+
+class ClientDisconnected(GenerationError):
+    # Code non standard (nginx) : le client a fermé la connexion
+    status_code = 499
+
+
+@dataclass
+class Deadline:
+    expires_at: float  # time.monotonic()
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+async def open_stream(client: httpx.AsyncClient, url: str, payload: Dict[str, Any], deadline: Deadline,
+                      retries: int = 2, backoff: float = 0.25, connect_timeout: float = 5.0) -> httpx.Response:
+    """
+    POST en streaming; seules les erreurs de connexion sont reprises (au plus `retries` fois,
+    attente aléatoire entre 0 et backoff * 2^n), et jamais au-delà de l'échéance.
+    Pas de délai de lecture: l'échéance est appliquée par l'appelant, qui annule l'appel.
+    """
+    attempt = 0
+    while True:
+        timeout = httpx.Timeout(None, connect=max(0.001, min(connect_timeout, deadline.remaining())))
+        request = client.build_request("POST", url, json=payload, timeout=timeout)
+        try:
+            return await client.send(request, stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            attempt += 1
+            delay = random.uniform(0, backoff * 2 ** (attempt - 1))
+            if attempt > retries or delay >= deadline.remaining():
+                raise OllamaUnavailable(f"Ollama injoignable après {attempt} tentative(s): {e}") from e
+            logger.warning(f"Connexion à Ollama impossible ({e}), nouvelle tentative dans {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def stream_generate(client: httpx.AsyncClient, base_url: str, payload: Dict[str, Any], deadline: Deadline,
+                          is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+                          retries: int = 2) -> Dict[str, Any]:
+    """
+    Générer en streaming et retourner l'équivalent d'une réponse non streamée
+    (dernier message d'Ollama, `response` complet) avec `truncated`.
+
+    La lecture est annulée, et la connexion à Ollama fermée (ce qui interrompt la génération),
+    dès que l'échéance est atteinte ou que `is_disconnected()` devient vrai, y compris pendant
+    le chargement du modèle et l'évaluation du prompt, avant le premier token:
+
+    - échéance: le texte déjà reçu est retourné avec `truncated=True`
+      (DeadlineExceeded si rien n'a été reçu);
+    - client déconnecté: ClientDisconnected.
+    """
+    pieces = []
+    final: Dict[str, Any] = {}
+    disconnected = False
+
+    async def read():
+        response = await open_stream(client, f"{base_url}/api/generate", dict(payload, stream=True),
+                                     deadline, retries)
+        try:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", "replace")
+                raise GenerationError(f"Erreur lors de la génération: {response.status_code} - {body}")
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise GenerationError(f"Erreur lors de la génération: {chunk['error']}")
+                pieces.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    final.update(chunk)
+                    return
+        finally:
+            await response.aclose()
+
+    async def watch(task: asyncio.Future):
+        nonlocal disconnected
+        while not task.done():
+            await asyncio.sleep(DISCONNECT_CHECK_INTERVAL)
+            if await is_disconnected():
+                disconnected = True
+                task.cancel()
+                return
+
+    task = asyncio.ensure_future(read())
+    watcher = asyncio.ensure_future(watch(task)) if is_disconnected is not None else None
+    try:
+        await asyncio.wait_for(task, timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        pass
+    except asyncio.CancelledError:
+        # Annulation demandée par la surveillance du client; sinon, celle de l'appelant
+        if not disconnected:
+            raise
+    except GenerationError as e:
+        e.generated_tokens = len(pieces)
+        raise
+    except httpx.HTTPError as e:
+        raise GenerationError(f"Flux Ollama interrompu: {e}", len(pieces)) from e
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+    if disconnected:
+        raise ClientDisconnected("Client déconnecté, génération interrompue", len(pieces))
+    if not final and not "".join(pieces):
+        raise DeadlineExceeded("Échéance atteinte avant le premier token", len(pieces))
+
+    result = dict(final)
+    result["response"] = "".join(pieces)
+    result["truncated"] = not final
+    if not final:
+        # Un message par token généré: sert au décompte des quotas
+        result["eval_count"] = len(pieces)
+        logger.info(f"Échéance atteinte: réponse partielle ({len(pieces)} tokens)")
+    return result
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Encodage des requêtes: cache LRU et regroupement des requêtes concurrentes en un seul lot
+"""
+
+import threading
+import time
+import logging
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from shared_state import SQLiteCache, cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class QueryEmbeddingStats:
+    """
+    Compteurs du cache et des lots (thread-safe)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self.max_batch_size = 0
+        self.total_encode_ms = 0.0
+        self.total_wait_ms = 0.0
+
+    def record_lookup(self, hit: bool, shared: bool = False):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.shared_hits += shared
+            else:
+                self.misses += 1
+
+    def record_batch(self, size: int, encode_ms: float):
+        with self._lock:
+            self.batches += 1
+            self.batched_queries += size
+            self.max_batch_size = max(self.max_batch_size, size)
+            self.total_encode_ms += encode_ms
+
+    def record_wait(self, wait_ms: float):
+        with self._lock:
+            self.total_wait_ms += wait_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "lookups": lookups,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "shared_hits": self.shared_hits,
+                "batches": self.batches,
+                "avg_batch_size": round(self.batched_queries / self.batches, 2) if self.batches else None,
+                "max_batch_size": self.max_batch_size,
+                "avg_encode_ms_per_batch": round(self.total_encode_ms / self.batches, 2) if self.batches else None,
+                "avg_latency_ms_per_miss": round(self.total_wait_ms / self.misses, 2) if self.misses else None,
+            }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Enveloppe d'un modèle d'embeddings pour la recherche:
+
+    - `embed_query` consulte d'abord un cache LRU de `cache_size` requêtes;
+    - les requêtes absentes du cache arrivant à moins de `batch_window_ms` d'intervalle
+      sont encodées ensemble (un seul passage du modèle, au plus `max_batch_size` requêtes);
+    - `embed_documents` (indexation) est transmis tel quel au modèle.
+
+    Avec `shared_cache`, les vecteurs encodés sont aussi écrits dans un cache SQLite lu par
+    les autres processus (workers, conteneurs) avant d'encoder une requête absente du cache LRU.
+
+    Les requêtes sont encodées avec `embed_documents`: ne convient qu'aux modèles symétriques
+    (comme all-MiniLM-L6-v2), pas à ceux qui préfixent différemment requêtes et documents.
+    """
+
+    def __init__(self, base: Embeddings, cache_size: int = 1024, batch_window_ms: float = 5.0,
+                 max_batch_size: int = 32, shared_cache: Optional[SQLiteCache] = None):
+        self.base = base
+        self.shared_cache = shared_cache
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.stats = QueryEmbeddingStats()
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self._pending: "OrderedDict[str, Future]" = OrderedDict()
+        # Requêtes du lot en cours d'encodage
+        self._in_flight: Dict[str, Future] = {}
+        self._pending_lock = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+
+    def _cache_get(self, text: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+            return vector
+
+    def _cache_put(self, text: str, vector: List[float]):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _shared_get(self, text: str) -> Optional[List[float]]:
+        if self.shared_cache is None:
+            return None
+        try:
+            data = self.shared_cache.get(cache_key(text))
+        except Exception as e:
+            logger.warning(f"Cache partagé des requêtes indisponible: {e}")
+            return None
+        return array("f", data).tolist() if data is not None else None
+
+    def _shared_put(self, items: List[tuple]):
+        if self.shared_cache is None:
+            return
+        try:
+            for text, vector in items:
+                self.shared_cache.set(cache_key(text), array("f", vector).tobytes())
+        except Exception as e:
+            logger.warning(f"Cache partagé des requêtes indisponible: {e}")
+
+    # ------------------------------------------------------------------
+    # Regroupement
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._pending_lock:
+                while not self._pending:
+                    self._pending_lock.wait()
+                # Laisser le temps aux requêtes concurrentes de rejoindre le lot
+                deadline = time.monotonic() + self.batch_window
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_lock.wait(remaining)
+                batch = []
+                while self._pending and len(batch) < self.max_batch_size:
+                    batch.append(self._pending.popitem(last=False))
+                self._in_flight.update(batch)
+
+            texts = [text for text, _ in batch]
+            start = time.perf_counter()
+            try:
+                vectors = self.base.embed_documents(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                self._finish(texts)
+                continue
+            self.stats.record_batch(len(texts), (time.perf_counter() - start) * 1000)
+
+            for (text, future), vector in zip(batch, vectors):
+                self._cache_put(text, vector)
+                future.set_result(vector)
+            self._finish(texts)
+            self._shared_put(list(zip(texts, vectors)))
+
+    def _finish(self, texts: List[str]):
+        with self._pending_lock:
+            for text in texts:
+                self._in_flight.pop(text, None)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._cache_get(text)
+        shared = False
+        if vector is None:
+            vector = self._shared_get(text)
+            if vector is not None:
+                shared = True
+                self._cache_put(text, vector)
+        self.stats.record_lookup(vector is not None, shared)
+        if vector is not None:
+            return vector
+
+        start = time.perf_counter()
+        with self._pending_lock:
+            # Une même requête en attente ou en cours d'encodage partage le résultat
+            future = self._pending.get(text) or self._in_flight.get(text)
+            if future is None:
+                future = Future()
+                self._pending[text] = future
+                self._ensure_worker()
+                self._pending_lock.notify()
+        vector = future.result()
+        self.stats.record_wait((time.perf_counter() - start) * 1000)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
@@ -1,9 +1,22 @@
-from fastapi import FastAPI, HTTPException
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+import httpx
 import requests
 import os
 from typing import List, Optional
 import logging
+import math
+from pathlib import Path
+
+from model_manager import ModelResidencyTracker
+from chat_sessions import SessionStore, build_context_prefix, build_question
+from rate_limit import RateLimiter
+from shared_state import FileLock, SQLiteCache, cache_key, worker_count
+from ollama_client import ClientDisconnected, Deadline, DeadlineExceeded, GenerationError, stream_generate
 
 # Configuration des logs
 logging.basicConfig(level=logging.INFO)
@@ -14,6 +27,43 @@ app = FastAPI(title="RAG API", description="API pour système RAG avec Ollama")
 # Configuration
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 DEFAULT_MODEL = "llama2"  # ou votre modèle préféré
+# Durée pendant laquelle Ollama garde un modèle chargé après une requête ("-1" = toujours)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Modèles chargés au démarrage, séparés par des virgules (vide = aucun)
+PRELOAD_MODELS = [
+    name.strip() for name in os.getenv("OLLAMA_PRELOAD_MODELS", DEFAULT_MODEL).split(",") if name.strip()
+]
+
+# Délai d'une génération sans en-tête X-Request-Timeout, et délai maximal accepté (secondes)
+OLLAMA_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_TIMEOUT_SECONDS", "60"))
+OLLAMA_MAX_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_MAX_TIMEOUT_SECONDS", "300"))
+# Nouvelles tentatives en cas d'erreur de connexion à Ollama
+OLLAMA_CONNECT_RETRIES = int(os.getenv("OLLAMA_CONNECT_RETRIES", "2"))
+
+# Au-delà, l'état Ollama d'une session est abandonné et le contexte renvoyé en entier
+SESSION_MAX_CONTEXT_TOKENS = int(os.getenv("SESSION_MAX_CONTEXT_TOKENS", "3500"))
+
+# État partagé entre workers (sessions, réponses): fichier SQLite sur un volume commun.
+# Activé par défaut dès que plusieurs workers tournent (WEB_CONCURRENCY > 1)
+SHARED_STATE_PATH = os.getenv(
+    "RAG_SHARED_STATE_PATH", "data/cache/rag_api.sqlite" if worker_count() > 1 else ""
+)
+# Durée de vie des réponses de /query en cache partagé (0 = pas de cache)
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "600"))
+
+model_tracker = ModelResidencyTracker(OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE)
+session_store = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX_COUNT", "256")),
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "3600")),
+    shared_path=SHARED_STATE_PATH or None
+)
+rate_limiter = RateLimiter.from_env()
+answer_cache = None
+if SHARED_STATE_PATH and ANSWER_CACHE_TTL_SECONDS > 0:
+    answer_cache = SQLiteCache(SHARED_STATE_PATH, namespace="answers", ttl_seconds=ANSWER_CACHE_TTL_SECONDS)
+answer_cache_stats = {"hits": 0, "misses": 0}
+# Générations: client asynchrone, annulable depuis la boucle d'événements
+http_client = httpx.AsyncClient()
 
 class QueryRequest(BaseModel):
     question: str
@@ -24,6 +74,118 @@ class QueryResponse(BaseModel):
     answer: str
     model_used: str
     context_used: Optional[str] = None
+    cached: bool = False
+    # Échéance atteinte: réponse partielle
+    truncated: bool = False
+
+class SessionCreateRequest(BaseModel):
+    context: str
+    model: Optional[str] = DEFAULT_MODEL
+
+class SessionQueryRequest(BaseModel):
+    question: str
+
+class SessionQueryResponse(BaseModel):
+    answer: str
+    model_used: str
+    session_id: str
+    turn: int
+    context_reused: bool
+    prompt_eval_count: Optional[int] = None
+    prompt_eval_ms: Optional[float] = None
+    truncated: bool = False
+
+async def require_tenant(x_api_key: Optional[str] = Header(default=None)) -> str:
+    """Identifier le locataire (en-tête X-API-Key) sans décompter de requête"""
+    tenant = rate_limiter.resolve_tenant(x_api_key)
+    if tenant is None:
+        raise HTTPException(status_code=401, detail="Clé API manquante ou inconnue")
+    return tenant
+
+async def request_deadline(x_request_timeout: Optional[float] = Header(default=None)) -> Deadline:
+    """Échéance de la requête: en-tête X-Request-Timeout (secondes), borné par OLLAMA_MAX_TIMEOUT_SECONDS"""
+    seconds = OLLAMA_TIMEOUT_SECONDS if x_request_timeout is None else x_request_timeout
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout doit être un nombre positif")
+    return Deadline.after(min(seconds, OLLAMA_MAX_TIMEOUT_SECONDS))
+
+async def enforce_rate_limit(tenant: str = Depends(require_tenant),
+                             deadline: Deadline = Depends(request_deadline)) -> str:
+    """Appliquer les quotas du locataire, après validation de l'échéance (un 400 n'est pas décompté)"""
+    decision = rate_limiter.check(tenant)
+    if not decision.allowed:
+        retry_after = max(1, math.ceil(decision.retry_after))
+        quota = "requêtes" if decision.reason == "requests" else "tokens générés"
+        raise HTTPException(
+            status_code=429,
+            detail=f"Quota de {quota} dépassé pour {tenant}, réessayer dans {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+    return tenant
+
+async def ollama_generate(ollama_request: dict, deadline: Deadline, tenant: Optional[str] = None,
+                          http_request: Optional[Request] = None) -> dict:
+    """
+    Appeler /api/generate avec le keep-alive configuré, interrompre la génération si le
+    client se déconnecte, et suivre le chargement du modèle et les tokens consommés
+    """
+    ollama_request = dict(ollama_request, keep_alive=OLLAMA_KEEP_ALIVE)
+    generated = 0
+    try:
+        result = await stream_generate(
+            http_client, OLLAMA_BASE_URL, ollama_request, deadline,
+            is_disconnected=http_request.is_disconnected if http_request is not None else None,
+            retries=OLLAMA_CONNECT_RETRIES
+        )
+        generated = result.get("eval_count", 0)
+    except GenerationError as e:
+        # Tokens produits avant l'échec ou la déconnexion: décomptés aussi
+        generated = e.generated_tokens
+        raise
+    finally:
+        if tenant:
+            rate_limiter.charge_tokens(tenant, generated)
+    model_tracker.record_generation(ollama_request["model"], result)
+    return result
+
+def generation_error(e: GenerationError) -> HTTPException:
+    """Journaliser un échec de génération et le convertir en réponse HTTP"""
+    if isinstance(e, ClientDisconnected):
+        logger.info(str(e))
+    else:
+        logger.error(f"Erreur Ollama: {str(e)}")
+    return HTTPException(status_code=e.status_code, detail=str(e))
+
+# Temps de démarrage, complété à la fin de l'import et dans l'événement startup
+startup_report = {}
+# Verrou gardé par le worker chargé du préchargement, jusqu'à son arrêt
+preload_lock = None
+
+@app.on_event("startup")
+async def preload_models():
+    """Précharger les modèles configurés sans bloquer le démarrage"""
+    startup_report["ready_seconds"] = round(time.perf_counter() - _import_started, 3)
+    startup_report["pid"] = os.getpid()
+    logger.info(
+        f"API prête en {startup_report['ready_seconds']}s "
+        f"(imports et initialisation: {startup_report['import_seconds']}s, worker {os.getpid()})"
+    )
+    if not PRELOAD_MODELS:
+        return
+    if SHARED_STATE_PATH:
+        # Plusieurs workers: un seul précharge (et télécharge) les modèles
+        global preload_lock
+        lock = FileLock(Path(SHARED_STATE_PATH).parent / "preload.lock", blocking=False)
+        if not lock.acquire():
+            logger.info("Préchargement pris en charge par un autre worker")
+            return
+        preload_lock = lock
+    logger.info(f"Préchargement des modèles: {', '.join(PRELOAD_MODELS)}")
+    model_tracker.preload_in_background(PRELOAD_MODELS)
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
 
 @app.get("/")
 async def root():
@@ -56,93 +218,170 @@ async def get_available_models():
         logger.error(f"Erreur lors de la récupération des modèles: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de connexion à Ollama: {str(e)}")
 
+@app.get("/metrics")
+async def get_metrics(tenant: str = Depends(require_tenant)):
+    """Statistiques de fonctionnement (résidence des modèles, cold starts); quotas du seul appelant"""
+    # Appel HTTP synchrone à Ollama (/api/ps): hors de la boucle d'événements
+    await run_in_threadpool(model_tracker.refresh)
+    return {
+        "startup": startup_report,
+        "models": model_tracker.snapshot(),
+        "sessions": session_store.snapshot(),
+        "rate_limits": rate_limiter.snapshot(tenant),
+        "shared_state": {
+            "path": SHARED_STATE_PATH or None,
+            "workers": worker_count(),
+            "answer_cache": dict(answer_cache_stats, enabled=answer_cache is not None)
+        }
+    }
+
 @app.post("/query", response_model=QueryResponse)
-async def query_rag(request: QueryRequest):
+async def query_rag(request: QueryRequest, http_request: Request,
+                    tenant: str = Depends(enforce_rate_limit),
+                    deadline: Deadline = Depends(request_deadline)):
     """Effectuer une requête RAG"""
     try:
-        # Attendre qu'Ollama soit prêt
-        health_response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
-        if health_response.status_code != 200:
-            raise HTTPException(status_code=503, detail="Service Ollama non disponible")
-
         # Préparer le prompt avec le contexte si fourni
+        # (contexte et consignes en tête: préfixe identique d'une question à l'autre)
         if request.context:
-            prompt = f"""Contexte: {request.context}
-
-Question: {request.question}
-
-Réponds en te basant sur le contexte fourni. Si l'information n'est pas dans le contexte, indique-le clairement."""
+            prompt = build_context_prefix(request.context) + build_question(request.question)
         else:
             prompt = request.question
 
+        # Même question sur le même contexte déjà traitée par un worker
+        key = cache_key(request.model, prompt)
+        if answer_cache is not None:
+            # SQLite peut attendre un autre worker: hors de la boucle d'événements
+            answer = await run_in_threadpool(answer_cache.get_json, key)
+            answer_cache_stats["hits" if answer is not None else "misses"] += 1
+            if answer is not None:
+                return QueryResponse(
+                    answer=answer,
+                    model_used=request.model,
+                    context_used=request.context,
+                    cached=True
+                )
+
         # Préparer la requête pour Ollama
         ollama_request = {
             "model": request.model,
-            "prompt": prompt,
-            "stream": False
+            "prompt": prompt
         }
 
-        # Envoyer la requête à Ollama
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json=ollama_request,
-            timeout=60
-        )
+        # Envoyer la requête à Ollama (Ollama injoignable: 503 après les nouvelles tentatives)
+        result = await ollama_generate(ollama_request, deadline, tenant, http_request)
 
-        if response.status_code == 200:
-            result = response.json()
-            return QueryResponse(
-                answer=result.get("response", "Aucune réponse générée"),
-                model_used=request.model,
-                context_used=request.context
-            )
-        else:
-            logger.error(f"Erreur Ollama: {response.status_code} - {response.text}")
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Erreur lors de la génération: {response.text}"
-            )
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Erreur de connexion à Ollama: {str(e)}")
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Erreur de connexion à Ollama: {str(e)}"
+        if answer_cache is not None and result["response"] and not result["truncated"]:
+            await run_in_threadpool(answer_cache.set_json, key, result["response"])
+        return QueryResponse(
+            answer=result["response"] or "Aucune réponse générée",
+            model_used=request.model,
+            context_used=request.context,
+            truncated=result["truncated"]
         )
+
+    except GenerationError as e:
+        raise generation_error(e)
     except Exception as e:
         logger.error(f"Erreur inattendue: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur inattendue: {str(e)}")
 
 @app.post("/chat")
-async def chat_with_model(request: QueryRequest):
+async def chat_with_model(request: QueryRequest, http_request: Request,
+                          tenant: str = Depends(enforce_rate_limit),
+                          deadline: Deadline = Depends(request_deadline)):
     """Interface de chat simple avec le modèle"""
     try:
         ollama_request = {
             "model": request.model,
-            "prompt": request.question,
-            "stream": False
+            "prompt": request.question
         }
 
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json=ollama_request,
-            timeout=60
-        )
-
-        if response.status_code == 200:
-            result = response.json()
-            return {
-                "response": result.get("response", "Aucune réponse générée"),
-                "model": request.model
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Erreur lors de la génération")
+        result = await ollama_generate(ollama_request, deadline, tenant, http_request)
+        return {
+            "response": result["response"] or "Aucune réponse générée",
+            "model": request.model,
+            "truncated": result["truncated"]
+        }
 
+    except GenerationError as e:
+        raise generation_error(e)
     except Exception as e:
         logger.error(f"Erreur chat: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/sessions")
+async def create_session(request: SessionCreateRequest, tenant: str = Depends(enforce_rate_limit)):
+    """Ouvrir une conversation sur un contexte fixe (le contexte n'est envoyé qu'une fois)"""
+    # Décomptée comme une requête: chaque session occupe une place du stockage commun
+    session = await run_in_threadpool(
+        session_store.create, model=request.model, context=request.context, tenant=tenant
+    )
+    return {"session_id": session.session_id, "model": session.model}
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str, tenant: str = Depends(require_tenant)):
+    """Historique et statistiques d'une conversation"""
+    session = await run_in_threadpool(session_store.get, session_id, tenant)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session introuvable ou expirée")
+    return session.summary()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, tenant: str = Depends(require_tenant)):
+    if not await run_in_threadpool(session_store.delete, session_id, tenant):
+        raise HTTPException(status_code=404, detail="Session introuvable ou expirée")
+    return {"deleted": session_id}
+
+@app.post("/sessions/{session_id}/query", response_model=SessionQueryResponse)
+async def query_session(session_id: str, request: SessionQueryRequest, http_request: Request,
+                        tenant: str = Depends(enforce_rate_limit),
+                        deadline: Deadline = Depends(request_deadline)):
+    """Poser une question de suivi en réutilisant l'état Ollama de la session"""
+    # Les tours d'une même session sont séquentiels: chacun dépend du contexte du précédent.
+    # Pas de verrou pour une session inconnue; attente du tour précédent bornée par l'échéance
+    turn_lock = await run_in_threadpool(session_store.lock, session_id, tenant)
+    if turn_lock is None:
+        raise HTTPException(status_code=404, detail="Session introuvable ou expirée")
+    try:
+        await turn_lock.acquire(deadline.remaining())
+    except TimeoutError:
+        raise generation_error(DeadlineExceeded("Échéance atteinte en attendant le tour précédent de la session"))
+    try:
+        # Relue sous verrou: le tour précédent a pu être traité par un autre worker
+        session = await run_in_threadpool(session_store.get, session_id, tenant)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session introuvable ou expirée")
+
+        ollama_request = session.build_request(request.question, SESSION_MAX_CONTEXT_TOKENS)
+        result = await ollama_generate(ollama_request, deadline, tenant, http_request)
+        turn = session.record_turn(request.question, ollama_request, result)
+        await run_in_threadpool(session_store.save, session)
+        return SessionQueryResponse(
+            answer=result["response"] or "Aucune réponse générée",
+            model_used=session.model,
+            session_id=session.session_id,
+            turn=turn["turn"],
+            context_reused=turn["context_reused"],
+            prompt_eval_count=turn["prompt_eval_count"],
+            prompt_eval_ms=turn["prompt_eval_ms"],
+            truncated=turn["truncated"]
+        )
+
+    except HTTPException:
+        raise
+    except GenerationError as e:
+        raise generation_error(e)
+    except Exception as e:
+        logger.error(f"Erreur inattendue: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur inattendue: {str(e)}")
+    finally:
+        turn_lock.release()
+
+startup_report["import_seconds"] = round(time.perf_counter() - _import_started, 3)
+
 if __name__ == "__main__":
+    # Un seul processus; en production: gunicorn -c gunicorn.conf.py rag_api:app
     import uvicorn
     logger.info("Démarrage de l'API RAG...")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
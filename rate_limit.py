@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Limitation de débit par locataire (clé API): requêtes et tokens générés, par token bucket
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from shared_state import worker_count
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS_TENANT = "anonymous"
+
+
+class TokenBucket:
+    """
+    Seau rempli en continu à `rate` unités/s jusqu'à `capacity`.
+    Le solde peut devenir négatif via `charge` (consommation connue après coup).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_consume(self, amount: float = 1.0) -> float:
+        """
+        Consommer `amount` si possible; retourne 0, ou le nombre de secondes à attendre
+        """
+        with self._lock:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return 0.0
+            return (amount - self.level) / self.rate if self.rate > 0 else math.inf
+
+    def charge(self, amount: float):
+        with self._lock:
+            self._refill()
+            self.level -= amount
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.level
+
+
+@dataclass
+class TenantQuota:
+    requests_per_minute: float = 0  # 0 = illimité
+    tokens_per_minute: float = 0
+    request_burst: Optional[float] = None
+    token_burst: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TenantQuota":
+        return cls(
+            requests_per_minute=float(data.get("requests_per_minute", 0)),
+            tokens_per_minute=float(data.get("tokens_per_minute", 0)),
+            request_burst=data.get("request_burst"),
+            token_burst=data.get("token_burst"),
+        )
+
+    def split(self, workers: int) -> "TenantQuota":
+        """
+        Part d'un worker quand le quota est réparti entre `workers` processus.
+        La capacité d'un seau reste d'au moins 1, sinon une requête ne passerait jamais:
+        pour les petits quotas, le débit cumulé peut alors dépasser le quota configuré.
+        """
+        if workers <= 1:
+            return self
+
+        def _burst(per_minute: float, burst: Optional[float]) -> Optional[float]:
+            if not per_minute:
+                return None
+            return max(1.0, float(burst or per_minute) / workers)
+
+        return TenantQuota(
+            requests_per_minute=self.requests_per_minute / workers,
+            tokens_per_minute=self.tokens_per_minute / workers,
+            request_burst=_burst(self.requests_per_minute, self.request_burst),
+            token_burst=_burst(self.tokens_per_minute, self.token_burst),
+        )
+
+
+class TenantState:
+    def __init__(self, name: str, quota: TenantQuota):
+        self.name = name
+        self.quota = quota
+        self.requests = self._bucket(quota.requests_per_minute, quota.request_burst)
+        self.tokens = self._bucket(quota.tokens_per_minute, quota.token_burst)
+        self.allowed = 0
+        self.rejected_requests = 0
+        self.rejected_tokens = 0
+        self.generated_tokens = 0
+
+    @staticmethod
+    def _bucket(per_minute: float, burst: Optional[float]) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        # Par défaut, une minute de quota peut être consommée d'un coup
+        return TokenBucket(per_minute / 60, float(burst) if burst else per_minute)
+
+
+@dataclass
+class RateLimitDecision:
+    tenant: str
+    allowed: bool
+    retry_after: float = 0.0
+    reason: Optional[str] = None
+
+
+class RateLimiter:
+    """
+    Quotas par locataire. Configuration (JSON) : clé API -> {"tenant", "requests_per_minute",
+    "tokens_per_minute", "request_burst", "token_burst"}; sans "tenant", le locataire reçoit
+    un nom opaque dérivé de la clé. Les appels sans clé utilisent le quota `default_quota`
+    (illimité par défaut) sous le nom "anonymous".
+
+    Les compteurs sont propres au processus: avec `workers` > 1, chaque worker applique
+    1/workers du quota, ce qui suppose une répartition à peu près égale des requêtes
+    (capacité d'au moins une requête par worker, voir `TenantQuota.split`).
+    """
+
+    def __init__(self, api_keys: Optional[Dict[str, Dict[str, Any]]] = None,
+                 default_quota: Optional[TenantQuota] = None, require_key: bool = False,
+                 workers: int = 1):
+        self.require_key = require_key
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._keys: Dict[str, str] = {}
+        self._tenants: Dict[str, TenantState] = {
+            ANONYMOUS_TENANT: TenantState(ANONYMOUS_TENANT, (default_quota or TenantQuota()).split(workers))
+        }
+        for api_key, config in (api_keys or {}).items():
+            name = config.get("tenant") or self.anonymous_label(api_key)
+            self._keys[api_key] = name
+            if name not in self._tenants:
+                self._tenants[name] = TenantState(name, TenantQuota.from_dict(config).split(workers))
+
+    @staticmethod
+    def anonymous_label(api_key: str) -> str:
+        """
+        Nom d'un locataire configuré sans "tenant": opaque, ne révèle rien de la clé
+        """
+        return "tenant-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """
+        RAG_API_TENANTS (JSON) ou RAG_API_TENANTS_FILE (chemin d'un fichier JSON),
+        RATE_LIMIT_DEFAULT_RPM / RATE_LIMIT_DEFAULT_TPM pour les appels sans clé,
+        RATE_LIMIT_REQUIRE_KEY=true pour refuser les appels sans clé.
+        Les quotas sont répartis entre les WEB_CONCURRENCY workers.
+        """
+        api_keys = {}
+        if os.getenv("RAG_API_TENANTS_FILE"):
+            api_keys = json.loads(Path(os.environ["RAG_API_TENANTS_FILE"]).read_text(encoding="utf-8"))
+        elif os.getenv("RAG_API_TENANTS"):
+            api_keys = json.loads(os.environ["RAG_API_TENANTS"])
+
+        default_quota = TenantQuota(
+            requests_per_minute=float(os.getenv("RATE_LIMIT_DEFAULT_RPM", "0")),
+            tokens_per_minute=float(os.getenv("RATE_LIMIT_DEFAULT_TPM", "0")),
+        )
+        require_key = os.getenv("RATE_LIMIT_REQUIRE_KEY", "false").lower() in ("1", "true", "yes")
+        if api_keys:
+            logger.info(f"Limitation de débit: {len(api_keys)} clé(s) API configurée(s)")
+        return cls(api_keys, default_quota, require_key, workers=worker_count())
+
+    def resolve_tenant(self, api_key: Optional[str]) -> Optional[str]:
+        """
+        Nom du locataire pour une clé API, None si la clé est refusée
+        """
+        if not api_key:
+            return None if self.require_key else ANONYMOUS_TENANT
+        return self._keys.get(api_key)
+
+    def check(self, tenant: str) -> RateLimitDecision:
+        """
+        Compter une requête; refusée si le quota de requêtes est épuisé ou si le
+        quota de tokens est déjà dépassé par les réponses précédentes
+        """
+        state = self._tenants[tenant]
+        if state.tokens is not None:
+            level = state.tokens.available()
+            if level <= 0:
+                with self._lock:
+                    state.rejected_tokens += 1
+                return RateLimitDecision(tenant, False, (1 - level) / state.tokens.rate, "tokens")
+
+        if state.requests is not None:
+            wait = state.requests.try_consume(1)
+            if wait:
+                with self._lock:
+                    state.rejected_requests += 1
+                return RateLimitDecision(tenant, False, wait, "requests")
+
+        with self._lock:
+            state.allowed += 1
+        return RateLimitDecision(tenant, True)
+
+    def charge_tokens(self, tenant: str, tokens: int):
+        """
+        Décompter les tokens générés (eval_count renvoyé par Ollama)
+        """
+        state = self._tenants.get(tenant)
+        if state is None or not tokens:
+            return
+        if state.tokens is not None:
+            state.tokens.charge(tokens)
+        with self._lock:
+            state.generated_tokens += tokens
+
+    def snapshot(self, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Totaux tous locataires confondus, et le détail du seul locataire `tenant`:
+        les noms des autres locataires ne sont pas exposés
+        """
+        with self._lock:
+            states = list(self._tenants.values())
+            totals = {
+                "tenants": len(states),
+                "allowed": sum(state.allowed for state in states),
+                "rejected_requests": sum(state.rejected_requests for state in states),
+                "rejected_tokens": sum(state.rejected_tokens for state in states),
+                "generated_tokens": sum(state.generated_tokens for state in states),
+            }
+        result = {"require_key": self.require_key, "workers": self.workers, "totals": totals}
+        state = self._tenants.get(tenant) if tenant else None
+        if state is not None:
+            result["tenant"] = {
+                "name": state.name,
+                "requests_per_minute": state.quota.requests_per_minute or None,
+                "tokens_per_minute": state.quota.tokens_per_minute or None,
+                "allowed": state.allowed,
+                "rejected_requests": state.rejected_requests,
+                "rejected_tokens": state.rejected_tokens,
+                "generated_tokens": state.generated_tokens,
+                "requests_available": round(state.requests.available(), 1) if state.requests else None,
+                "tokens_available": round(state.tokens.available(), 1) if state.tokens else None,
+            }
+        return result
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Étape de reranking des chunks récupérés, avec budget de temps
+"""
+
+import threading
+import time
+import logging
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODES = ("mmr", "cross-encoder")
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+def load_cross_encoder(model_name: str = DEFAULT_CROSS_ENCODER):
+    """
+    Charger un petit cross-encoder sur CPU
+    """
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device="cpu", max_length=512)
+
+
+class RerankStats:
+    """
+    Latence ajoutée par le reranking (thread-safe)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.budget_exceeded = 0
+        self.candidates_scored = 0
+        self.candidates_fetched = 0
+        # Coût estimé d'une paire (moyenne glissante), conservé d'un appel à l'autre
+        self.pair_seconds = None
+
+    def observe_pairs(self, pairs: int, elapsed_seconds: float):
+        with self._lock:
+            observed = elapsed_seconds / pairs
+            if self.pair_seconds is None:
+                self.pair_seconds = observed
+            else:
+                self.pair_seconds = 0.7 * self.pair_seconds + 0.3 * observed
+
+    def estimated_pair_seconds(self):
+        with self._lock:
+            return self.pair_seconds
+
+    def record(self, elapsed_ms: float, fetched: int, scored: int, budget_exceeded: bool):
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.last_ms = elapsed_ms
+            self.candidates_fetched += fetched
+            self.candidates_scored += scored
+            self.budget_exceeded += int(budget_exceeded)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "avg_ms": round(self.total_ms / self.calls, 1) if self.calls else None,
+                "max_ms": round(self.max_ms, 1),
+                "last_ms": round(self.last_ms, 1),
+                "budget_exceeded": self.budget_exceeded,
+                "pair_ms": round(self.pair_seconds * 1000, 2) if self.pair_seconds is not None else None,
+                "scored_ratio": round(self.candidates_scored / self.candidates_fetched, 3)
+                if self.candidates_fetched else None,
+            }
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Sur-échantillonne `fetch_k` candidats dans le vector store puis ne garde que les `k` meilleurs,
+    par diversité (MMR) ou par score d'un cross-encoder calculé par lots.
+
+    La taille de chaque lot du cross-encoder est bornée par le budget restant (`time_budget_ms`)
+    et le coût estimé d'une paire, appris au fil des appels; sans estimation, le premier lot
+    ne contient qu'une paire. Les candidats non évalués gardent l'ordre de la recherche vectorielle.
+    """
+
+    vectorstore: VectorStore
+    mode: str = "cross-encoder"
+    k: int = 3
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    cross_encoder: Any = None
+    batch_size: int = 8
+    time_budget_ms: float = 250.0
+    stats: Any = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.mode not in RERANK_MODES:
+            raise ValueError(f"Mode de reranking inconnu: {self.mode}")
+        if self.mode == "cross-encoder" and self.cross_encoder is None:
+            raise ValueError("Un cross-encoder est requis pour le mode 'cross-encoder'")
+        if self.stats is None:
+            self.stats = RerankStats()
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if self.mode == "mmr":
+            start = time.perf_counter()
+            documents = self.vectorstore.max_marginal_relevance_search(
+                query, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+            )
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.stats.record(elapsed_ms, self.fetch_k, self.fetch_k, False)
+            return documents
+
+        candidates = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        return self._rerank(query, candidates)
+
+    def _rerank(self, query: str, candidates: List[Document]) -> List[Document]:
+        start = time.perf_counter()
+        budget_seconds = self.time_budget_ms / 1000
+        scores: List[float] = []
+
+        while len(scores) < len(candidates):
+            remaining = budget_seconds - (time.perf_counter() - start)
+            pair_seconds = self.stats.estimated_pair_seconds()
+            if pair_seconds is None:
+                # Coût encore inconnu: un premier lot d'une seule paire pour le mesurer
+                size = 1 if remaining > 0 else 0
+            else:
+                size = min(self.batch_size, int(remaining / pair_seconds)) if pair_seconds > 0 else self.batch_size
+            if size < 1:
+                break
+
+            batch_start = time.perf_counter()
+            batch = candidates[len(scores):len(scores) + size]
+            pairs = [(query, doc.page_content) for doc in batch]
+            scores.extend(float(score) for score in self.cross_encoder.predict(pairs, batch_size=self.batch_size))
+            self.stats.observe_pairs(len(batch), time.perf_counter() - batch_start)
+
+        scored = sorted(zip(scores, range(len(scores))), key=lambda item: item[0], reverse=True)
+        ranked = [candidates[index] for _, index in scored] + candidates[len(scores):]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        budget_exceeded = len(scores) < len(candidates) or elapsed_ms > self.time_budget_ms
+        self.stats.record(elapsed_ms, len(candidates), len(scores), budget_exceeded)
+        if budget_exceeded:
+            logger.info(
+                f"Budget de reranking dépassé: {len(scores)}/{len(candidates)} candidats évalués "
+                f"en {elapsed_ms:.0f} ms"
+            )
+        return ranked[:self.k]
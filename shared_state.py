@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+État partagé entre processus (workers de l'API, conteneurs): verrous de fichiers et cache SQLite
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """
+    Verrou exclusif entre processus (flock) sur `path`.
+    `blocking=False` permet de tenter l'acquisition sans attendre.
+    Le fichier peut être supprimé par son détenteur (`unlink`): un processus qui attendait
+    sur l'ancien fichier recommence alors sur le nouveau.
+    """
+
+    def __init__(self, path, timeout: float = 600, blocking: bool = True):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.blocking = blocking
+        self._handle = None
+
+    def acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = open(self.path, "a+")
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if self._is_current():
+                    return True
+                # Fichier supprimé pendant l'attente: verrouiller celui qui le remplace
+                self._handle.close()
+                self._handle = open(self.path, "a+")
+                continue
+            except BlockingIOError:
+                if not self.blocking or time.monotonic() > deadline:
+                    self._handle.close()
+                    self._handle = None
+                    if self.blocking:
+                        raise TimeoutError(f"Verrou {self.path} non obtenu après {self.timeout}s")
+                    return False
+                time.sleep(0.05)
+
+    def _is_current(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self._handle.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def unlink(self):
+        """
+        Supprimer le fichier de verrou; à appeler en détenant le verrou, avant `release`
+        """
+        self.path.unlink(missing_ok=True)
+
+    def release(self):
+        if self._handle is not None:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+            self._handle.close()
+            self._handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def cache_key(*parts: Any) -> str:
+    """
+    Clé stable à partir de valeurs sérialisables en JSON
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLiteCache:
+    """
+    Cache clé/valeur dans un fichier SQLite (mode WAL), partagé par tous les processus
+    qui ouvrent le même fichier. Les valeurs sont des octets; `get_json`/`set_json` pour le JSON.
+    """
+
+    def __init__(self, path, namespace: str = "default", ttl_seconds: float = 0, max_entries: int = 100_000):
+        self.path = Path(path)
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+                " created_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Une connexion par thread: sqlite3 ne partage pas les connexions entre threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._connection().execute(
+            "SELECT value, created_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        if self.ttl_seconds and row[1] < time.time() - self.ttl_seconds:
+            return None
+        return row[0]
+
+    def set(self, key: str, value: bytes):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, created_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, sqlite3.Binary(value), time.time())
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self.prune()
+
+    def delete(self, key: str):
+        self._connection().execute(
+            "DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, key: str, value: Any):
+        self.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def prune(self):
+        """
+        Supprimer les entrées expirées et les plus anciennes au-delà de `max_entries`
+        """
+        connection = self._connection()
+        if self.ttl_seconds:
+            connection.execute(
+                "DELETE FROM cache WHERE namespace = ? AND created_at < ?",
+                (self.namespace, time.time() - self.ttl_seconds)
+            )
+        connection.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries)
+        )
+
+    def count(self) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+
+def worker_count() -> int:
+    """
+    Nombre de workers de l'API (WEB_CONCURRENCY, comme gunicorn)
+    """
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
@@ -4,21 +4,14 @@ import tempfile
 from datetime import datetime
 import requests
 import time
+import threading
+import hashlib
 from pathlib import Path
 
-# Imports pour le traitement PDF et RAG
-try:
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain_community.embeddings import HuggingFaceEmbeddings
-    from langchain_community.vectorstores import FAISS
-    from langchain.chains import RetrievalQA
-    from langchain_community.document_loaders import PyPDFLoader
-    from langchain_community.llms import Ollama
-    from langchain_community.llms import Ollama as CommunityOllama
-except ImportError as e:
-    st.error(f"Erreur d'import : {e}")
-    st.stop()
+from utils import preload_ollama_model
 
+# Les dépendances lourdes (langchain, FAISS, sentence-transformers/torch) sont importées
+# à la première utilisation pour que la page s'affiche sans attendre leur chargement.
 
 # Configuration de la page
 st.set_page_config(
@@ -246,6 +239,35 @@ if 'current_pdf' not in st.session_state:
 
 # Configuration Ollama
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+
+# Reranking des chunks récupérés
+RERANK_OPTIONS = {
+    "Aucun": None,
+    "MMR (diversité)": "mmr",
+    "Cross-encoder": "cross-encoder",
+}
+RERANK_FETCH_K = int(os.getenv('RERANK_FETCH_K', '20'))
+RERANK_TIME_BUDGET_MS = float(os.getenv('RERANK_TIME_BUDGET_MS', '250'))
+
+# Découpage: "structure" (titres/paragraphes, taille en tokens) ou "recursive" (1000 caractères)
+CHUNKING_STRATEGY = os.getenv('CHUNKING_STRATEGY', 'structure')
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '240'))
+
+# Encodage des questions: taille du cache LRU et fenêtre de regroupement
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '1024'))
+QUERY_BATCH_WINDOW_MS = float(os.getenv('QUERY_BATCH_WINDOW_MS', '5'))
+
+# Stockage compact des vecteurs: "int8" (re-scoring en float16) ou "float16"
+COMPACT_QUANTIZATION = os.getenv('COMPACT_QUANTIZATION', 'int8')
+
+# État partagé entre sessions et conteneurs (volume commun en déploiement multi-instances):
+# index compacts par contenu de PDF, cache SQLite des vecteurs de questions ("" = désactivé)
+SHARED_INDEX_DIR = os.getenv('SHARED_INDEX_DIR', 'faiss_index/shared')
+# Éviction des index partagés: inutilisés depuis N jours, puis les plus anciens au-delà de N Mo (0 = jamais)
+SHARED_INDEX_MAX_AGE_DAYS = float(os.getenv('SHARED_INDEX_MAX_AGE_DAYS', '30'))
+SHARED_INDEX_MAX_MB = float(os.getenv('SHARED_INDEX_MAX_MB', '0'))
+QUERY_CACHE_PATH = os.getenv('QUERY_CACHE_PATH', 'data/cache/query_embeddings.sqlite')
 
 def check_ollama_connection():
     try:
@@ -281,6 +303,17 @@ def pull_model(model_name):
     except:
         return False
 
+def warm_up_model(model_name):
+    """Charger le modèle dans Ollama en arrière-plan dès qu'il est sélectionné"""
+    if st.session_state.get('warmed_model') == model_name:
+        return
+    st.session_state.warmed_model = model_name
+    threading.Thread(
+        target=preload_ollama_model,
+        args=(model_name, OLLAMA_URL, OLLAMA_KEEP_ALIVE),
+        daemon=True
+    ).start()
+
 def extract_text_from_pdf(pdf_file):
     try:
         upload_dir = Path("data/uploads")
@@ -290,6 +323,8 @@ def extract_text_from_pdf(pdf_file):
             tmp_file.write(pdf_file.getvalue())
             tmp_file_path = tmp_file.name
         
+        from langchain_community.document_loaders import PyPDFLoader
+        
         loader = PyPDFLoader(tmp_file_path)
         documents = loader.load()
         st.session_state.current_pdf = tmp_file_path
@@ -302,37 +337,134 @@ def extract_text_from_pdf(pdf_file):
 @st.cache_resource
 def get_embeddings():
     try:
-        return HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        from query_encoder import CachedQueryEmbeddings
+        from shared_state import SQLiteCache
+        
+        model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        shared_cache = None
+        if QUERY_CACHE_PATH:
+            shared_cache = SQLiteCache(QUERY_CACHE_PATH, namespace=model_name, max_entries=50_000)
+        
+        # Partagé entre les sessions: cache des questions et lots communs
+        return CachedQueryEmbeddings(
+            HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={'device': 'cpu'}
+            ),
+            cache_size=QUERY_CACHE_SIZE,
+            batch_window_ms=QUERY_BATCH_WINDOW_MS,
+            shared_cache=shared_cache
         )
     except Exception as e:
         st.error(f"❌ Erreur embeddings : {e}")
         return None
 
-def create_vector_store(documents):
+@st.cache_resource
+def get_chunker():
+    from chunking import StructureAwareChunker, make_token_counter
+    
+    return StructureAwareChunker(
+        max_tokens=CHUNK_MAX_TOKENS,
+        token_counter=make_token_counter("sentence-transformers/all-MiniLM-L6-v2")
+    )
+
+def split_documents(documents, strategy=None):
+    if (strategy or CHUNKING_STRATEGY) == "structure":
+        return get_chunker().split_documents(documents)
+    
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len
+    )
+    return text_splitter.split_documents(documents)
+
+def document_key(pdf_bytes):
+    """Identifiant d'un index: contenu du PDF et paramètres de découpage/quantification"""
+    digest = hashlib.sha256(pdf_bytes).hexdigest()[:32]
+    return f"{digest}-{CHUNKING_STRATEGY}-{CHUNK_MAX_TOKENS}-{COMPACT_QUANTIZATION}"
+
+def create_vector_store(documents, compact=False, key=None):
     try:
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
-        texts = text_splitter.split_documents(documents)
-        
         embeddings = get_embeddings()
         if not embeddings:
             return None
         
         with st.spinner("Création de l'index vectoriel..."):
-            vector_store = FAISS.from_documents(texts, embeddings)
+            if compact:
+                from compact_store import CompactVectorStore, prune_stores
+                
+                # Index partagé en lecture seule: construit une seule fois par document
+                def build():
+                    texts = split_documents(documents)
+                    return [doc.page_content for doc in texts], [doc.metadata for doc in texts]
+                
+                vector_store = CompactVectorStore.load_or_build(
+                    Path(SHARED_INDEX_DIR) / key, embeddings, build, quantization=COMPACT_QUANTIZATION
+                )
+                prune_stores(
+                    SHARED_INDEX_DIR,
+                    max_age_seconds=SHARED_INDEX_MAX_AGE_DAYS * 86400,
+                    max_bytes=int(SHARED_INDEX_MAX_MB * 1024 * 1024),
+                    keep=[key]
+                )
+            else:
+                from langchain_community.vectorstores import FAISS
+                
+                vector_store = FAISS.from_documents(split_documents(documents), embeddings)
         
         return vector_store
     except Exception as e:
         st.error(f"❌ Erreur vector store : {e}")
         return None
 
-def create_qa_chain(vector_store, model_name="llama2"):
+def release_vector_store():
+    """Fermer l'index compact précédent (ses fichiers restent partagés, voir prune_stores)"""
+    vector_store = st.session_state.get('vector_store')
+    if hasattr(vector_store, 'close'):
+        vector_store.close()
+
+@st.cache_resource
+def get_cross_encoder():
     try:
+        from reranker import load_cross_encoder
+        
+        return load_cross_encoder()
+    except Exception as e:
+        st.error(f"❌ Erreur cross-encoder : {e}")
+        return None
+
+def create_retriever(vector_store, rerank_mode=None):
+    if rerank_mode is None:
+        return vector_store.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": 3}
+        )
+
+    cross_encoder = get_cross_encoder() if rerank_mode == "cross-encoder" else None
+    if rerank_mode == "cross-encoder" and cross_encoder is None:
+        st.warning("⚠️ Cross-encoder indisponible, recherche par similarité")
+        return create_retriever(vector_store)
+
+    from reranker import RerankingRetriever
+    
+    return RerankingRetriever(
+        vectorstore=vector_store,
+        mode=rerank_mode,
+        k=3,
+        fetch_k=RERANK_FETCH_K,
+        cross_encoder=cross_encoder,
+        time_budget_ms=RERANK_TIME_BUDGET_MS
+    )
+
+def create_qa_chain(vector_store, model_name="llama2", rerank_mode=None):
+    try:
+        from langchain.chains import RetrievalQA
+        from langchain_community.llms import Ollama as CommunityOllama
+        
         llm = CommunityOllama(
             model=model_name,
             base_url=OLLAMA_URL,
@@ -342,10 +474,7 @@ def create_qa_chain(vector_store, model_name="llama2"):
         qa_chain = RetrievalQA.from_chain_type(
             llm=llm,
             chain_type="stuff",
-            retriever=vector_store.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 3}
-            ),
+            retriever=create_retriever(vector_store, rerank_mode),
             return_source_documents=True
         )
         
@@ -388,6 +517,7 @@ def main():
                     available_models,
                     label_visibility="collapsed"
                 )
+                warm_up_model(selected_model)
             else:
                 st.warning("Aucun modèle disponible")
                 model_options = ["llama3.2", "llama2", "mistral", "codellama"]
@@ -402,6 +532,8 @@ def main():
                             st.error("❌ Échec")
                 
                 selected_model = "llama3.2"
+            
+            rerank_label = st.selectbox("Reranking des passages", list(RERANK_OPTIONS))
         else:
             st.error("Vérifiez que Ollama est démarré")
             if st.button("🔄 Réessayer"):
@@ -425,6 +557,11 @@ def main():
             st.success(f"📁 {uploaded_file.name}")
             st.info(f"📊 {uploaded_file.size / (1024*1024):.1f} MB")
             
+            compact_storage = st.checkbox(
+                f"🗜️ Stockage compact ({COMPACT_QUANTIZATION})",
+                help="Vecteurs quantifiés et texte sur disque: moins de mémoire pour les gros documents"
+            )
+            
             if st.button("🚀 Analyser", type="primary"):
                 with st.spinner("Analyse en cours..."):
                     documents = extract_text_from_pdf(uploaded_file)
@@ -432,11 +569,25 @@ def main():
                     if documents:
                         st.success(f"✅ {len(documents)} pages")
                         
-                        vector_store = create_vector_store(documents)
+                        vector_store = create_vector_store(
+                            documents, compact=compact_storage, key=document_key(uploaded_file.getvalue())
+                        )
                         if vector_store:
-                            qa_chain = create_qa_chain(vector_store, selected_model)
+                            if hasattr(vector_store, 'memory_report'):
+                                report = vector_store.memory_report()
+                                st.info(
+                                    f"🗜️ {report['chunks']} chunks : {report['before_bytes_per_chunk']} → "
+                                    f"{report['after_ram_bytes_per_chunk']} octets/chunk en mémoire "
+                                    f"(+{report['after_disk_bytes_per_chunk']} sur disque)"
+                                )
+                            
+
+                            qa_chain = create_qa_chain(
+                                vector_store, selected_model, RERANK_OPTIONS[rerank_label]
+                            )
                             
                             if qa_chain:
+                                release_vector_store()
                                 st.session_state.vector_store = vector_store
                                 st.session_state.qa_chain = qa_chain
                                 st.session_state.pdf_processed = True
@@ -460,6 +611,7 @@ def main():
             st.markdown('<div class="status-waiting status-indicator">⏳ En attente</div>', unsafe_allow_html=True)
         
         if st.button("🗑️ Reset"):
+            release_vector_store()
             for key in ['vector_store', 'qa_chain', 'pdf_processed', 'question_history']:
                 if key in st.session_state:
                     del st.session_state[key]
@@ -502,9 +654,33 @@ def main():
                             if "source_documents" in result and result["source_documents"]:
                                 with st.expander("📚 Sources", expanded=False):
                                     for i, doc in enumerate(result["source_documents"]):
-                                        st.markdown(f"**Source {i+1}:**")
+                                        location = ""
+                                        if "page" in doc.metadata:
+                                            location = f" — page {doc.metadata['page'] + 1}"
+                                        if "start_index" in doc.metadata and "end_index" in doc.metadata:
+                                            location += f", caractères {doc.metadata['start_index']}–{doc.metadata['end_index']}"
+                                        st.markdown(f"**Source {i+1}{location}:**")
                                         st.write(doc.page_content[:300] + "...")
                                         st.markdown("---")
+                            
+                            from reranker import RerankingRetriever
+                            
+                            retriever = st.session_state.qa_chain.retriever
+                            if isinstance(retriever, RerankingRetriever):
+                                stats = retriever.stats.snapshot()
+                                st.caption(
+                                    f"⏱️ Reranking ({retriever.mode}) : {stats['last_ms']} ms "
+                                    f"(moyenne {stats['avg_ms']} ms, budget {retriever.time_budget_ms:.0f} ms)"
+                                )
+                            
+                            embeddings = get_embeddings()
+                            stats = embeddings.stats.snapshot() if hasattr(embeddings, 'stats') else {}
+                            if stats.get('lookups'):
+                                st.caption(
+                                    f"🔎 Encodage des questions : cache {stats['hit_rate']:.0%} "
+                                    f"({stats['lookups']} questions), lot moyen {stats['avg_batch_size']}, "
+                                    f"{stats['avg_latency_ms_per_miss']} ms par question encodée"
+                                )
                         
                         except Exception as e:
                             st.error(f"❌ Erreur: {e}")
@@ -182,4 +182,44 @@ def truncate_text(text: str, max_tokens: int = 4000) -> str:
     if last_space > max_chars * 0.8:  # Si on trouve un espace dans les 20% finaux
         truncated = truncated[:last_space]
     
-    return truncated + "..."
\ No newline at end of file
+    return truncated + "..."
+
+def preload_ollama_model(model_name: str, base_url: str = "http://localhost:11434",
+                         keep_alive: str = "30m", timeout: int = 600) -> Optional[float]:
+    """
+    Charger un modèle en mémoire dans Ollama sans générer de texte.
+    Retourne la durée de la requête en secondes (chargement compris), ou None en cas d'échec.
+    """
+    try:
+        # Une requête /api/generate sans prompt force le chargement du modèle.
+        # Sa réponse (done_reason "load") ne contient pas load_duration: durée mesurée ici
+        start = time.perf_counter()
+        response = requests.post(
+            f"{base_url}/api/generate",
+            json={"model": model_name, "keep_alive": keep_alive},
+            timeout=timeout
+        )
+        if response.status_code == 200:
+            load_seconds = time.perf_counter() - start
+            logger.info(f"🔥 Modèle {model_name} chargé en {load_seconds:.2f}s")
+            return load_seconds
+
+        logger.error(f"❌ Erreur préchargement {model_name}: {response.status_code}")
+        return None
+
+    except Exception as e:
+        logger.error(f"❌ Erreur préchargement modèle {model_name}: {e}")
+        return None
+
+def get_running_models(base_url: str = "http://localhost:11434") -> Optional[list]:
+    """
+    Lister les modèles actuellement chargés en mémoire par Ollama (/api/ps)
+    """
+    try:
+        response = requests.get(f"{base_url}/api/ps", timeout=5)
+        if response.status_code == 200:
+            return [model['name'] for model in response.json().get('models', [])]
+        return None
+    except Exception as e:
+        logger.error(f"❌ Erreur récupération des modèles chargés: {e}")
+        return None